@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import copy
+import json
+import pathlib
+import requests
+import threading
+from opendata import OpendataExport, load_authentication, portal_credentials
+from portals import find_portal, load_supported_portals
+
+_ABSOLUTE_PATH = pathlib.Path(__file__).parent.absolute()
+
+
+class _CollectingExport(OpendataExport):
+    """OpendataExport keeping its messages instead of printing them."""
+    def __init__(self, auth, url):
+        # Set first, the capabilities detection of the portal already reports its errors
+        self.messages = []
+        super().__init__(auth, url)
+
+    def _display(self, message):
+        self.messages.append(message)
+
+
+class OpendataClient():
+    """Importable equivalent of the opendata.py command line.
+
+    The supported portals, the credentials & the default body are loaded once, and the
+    connections to each portal are kept alive between calls. Every call returns a dict
+    with the `status` of the operation, its `result` (the dataset found, or the id &
+    links of what has been created, updated or deleted) and the `messages` the command
+    line would have displayed.
+    """
+    def __init__(self, auth=None, portal_url='data.public.lu', body=None, level='events', misp_url='https://misppriv.circl.lu'):
+        self._auth = auth
+        self._authentication = None
+        self._lock = threading.Lock()
+        self._supported_portals = load_supported_portals()
+        self.portal_url = portal_url
+        self.body = body
+        self.level = level
+        self.misp_url = misp_url
+
+    def delete(self, to_delete, portal_url=None, auth=None):
+        return self._run(portal_url, auth, lambda export: export.delete_data(to_delete))
+
+    def search(self, to_search, portal_url=None, auth=None):
+        return self._run(portal_url, auth, lambda export: export.search_data(to_search))
+
+    def submit(self, setup, body=None, level=None, misp_url=None, portal_url=None, auth=None,
+               checksum_type=None, misp_auth=None, incremental=False):
+        def submit_data(export):
+            export.load_query(
+                copy.deepcopy(setup), body if body is not None else self._default_body(),
+                level=level or self.level, misp_url=misp_url or self.misp_url, checksum_type=checksum_type, misp_auth=misp_auth, incremental=incremental
+            )
+            return export.submit_data()
+        return self._run(portal_url, auth, submit_data)
+
+    ################################################################################
+    #                              UTILITY FUNCTIONS                               #
+    ################################################################################
+
+    def _credentials(self, auth, portal_url):
+        auth = auth or self._auth
+        if auth is not None:
+            return {'X-API-KEY': auth}
+        with self._lock:
+            if self._authentication is None:
+                self._authentication = load_authentication()
+        return portal_credentials(self._authentication, portal_url)
+
+    def _default_body(self):
+        with self._lock:
+            if self.body is None:
+                with open(f'{_ABSOLUTE_PATH}/body.json', 'rt', encoding='utf-8') as f:
+                    self.body = json.loads(f.read())
+        return self.body
+
+    def _run(self, portal_url, auth, operation):
+        url_arg = portal_url or self.portal_url
+        portal_url = find_portal(url_arg, self._supported_portals)
+        if portal_url is None:
+            return {
+                'status': False, 'result': None,
+                'messages': [f'The provided portal url ({url_arg}) is not supported yet (or misspelled).']
+            }
+        try:
+            export = _CollectingExport(self._credentials(auth, portal_url), portal_url)
+        except (FileNotFoundError, PermissionError, json.JSONDecodeError) as error:
+            return {'status': False, 'result': None, 'messages': [f'The authentication file cannot be loaded: {error}']}
+        try:
+            status = operation(export)
+        except (FileNotFoundError, PermissionError, json.JSONDecodeError) as error:
+            export.messages.append(f'The body file cannot be loaded: {error}')
+            status = False
+        except (AttributeError, IndexError, KeyError, TypeError) as error:
+            export.messages.append(f'Invalid query, missing or malformed field: {error}')
+            status = False
+        except requests.RequestException as error:
+            export.messages.append(f'Your query encountered an error: {error}')
+            status = False
+        return {'status': bool(status), 'result': export.result, 'messages': export.messages}
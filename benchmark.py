@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import sys
+import time
+from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import submit_resource
+from mock_portal import MockPortal
+from opendata import OpendataExport
+from transport import add_arguments, configure_from_arguments
+
+_API_KEY = 'benchmark-api-key'
+_BODY = {
+    'returnFormat': 'json',
+    'tags': 'tlp:white'
+}
+_MISP_URL = 'https://misp.local'
+_PERCENTILES = (
+    50,
+    95,
+    99
+)
+_RESOURCE_FIELDS = (
+    'title',
+    'type',
+    'url',
+    'format',
+    'description',
+    'publication_date',
+    'filesize',
+    'mime_type',
+    'md5',
+    'sha1',
+    'sha256'
+)
+_STREAM_FIELDS = (
+    'id',
+    'title',
+    'url',
+    'last_modified'
+)
+
+
+class Benchmark():
+    """Drives the opendata.py & submit_resource.py features against a mock portal."""
+    def __init__(self, portal, datasets):
+        self._portal = portal
+        self._datasets = datasets
+        submit_resource._API_URL = f'{portal.url}api/1/'
+
+    ################################################################################
+    #                                  SCENARIOS                                   #
+    ################################################################################
+
+    @property
+    def scenarios(self):
+        return (
+            ('opendata.submit_data.create_dataset', self.create_dataset),
+            ('opendata.submit_data.create_resource', self.create_resource),
+            ('opendata.submit_data.update_resource', self.create_resource),
+            ('opendata.search_data.dataset', self.search_dataset),
+            ('opendata.search_data.resources', self.search_resources),
+            ('opendata.stream_search', self.stream_search),
+            ('submit_resource.submit', self.submit_resource),
+            ('submit_resource.update', self.update_resource),
+            ('submit_resource.search.slug', self.search_by_slug),
+            ('submit_resource.search.title', self.search_by_title),
+            ('opendata.delete_data.resource', self.delete_resource),
+            ('opendata.delete_data.dataset', self.delete_dataset)
+        )
+
+    def create_dataset(self, index):
+        return self._submit({'dataset': {'title': f'Benchmark dataset {index}', 'description': 'Benchmark dataset.'}})
+
+    def create_resource(self, index):
+        setup = {
+            'dataset': {'title': self._dataset_title(index), 'description': 'Benchmark dataset.'},
+            'resources': {'title': f'Benchmark resource {index}', 'type': 'main'}
+        }
+        return self._submit(setup)
+
+    def delete_dataset(self, index):
+        return self._export().delete_data([f'benchmark-dataset-{index}'])
+
+    def delete_resource(self, index):
+        return self._export().delete_data([self._dataset_slug(index), f'Benchmark resource {index}'])
+
+    def search_by_slug(self, index):
+        return submit_resource.search_dataset(
+            self._search_arguments(dataset_slug=self._dataset_slug(index), resource_title='Resource 0')
+        )
+
+    def search_by_title(self, index):
+        return submit_resource.search_dataset(self._search_arguments(dataset_title=self._dataset_title(index), auth=_API_KEY))
+
+    def search_dataset(self, index):
+        return self._export().search_data([self._dataset_slug(index)])
+
+    def search_resources(self, index):
+        return self._export().search_data([self._dataset_slug(index), 'Resource 0', 'Resource 1'])
+
+    def stream_search(self, index):
+        return self._export().stream_search([self._dataset_slug(index)], fields=_STREAM_FIELDS)
+
+    def submit_resource(self, index):
+        arguments = self._resource_arguments(
+            dataset_id=self._dataset_id(index), title=f'Submitted resource {index}', type='main',
+            url=f'{_MISP_URL}/attributes/restSearch/tags:benchmark-{index}', format='json'
+        )
+        return submit_resource.submit_resource(arguments)
+
+    def update_resource(self, index):
+        dataset = self._portal.state.find(self._dataset_slug(index))
+        resource_id = dataset['resources'][0]['id']
+        arguments = self._resource_arguments(
+            dataset_id=dataset['id'], resource_id=resource_id, description=f'Updated {index} times.'
+        )
+        return submit_resource.update_resource(arguments)
+
+    ################################################################################
+    #                              UTILITY FUNCTIONS                               #
+    ################################################################################
+
+    def _dataset_id(self, index):
+        return self._portal.state.find(self._dataset_slug(index))['id']
+
+    def _dataset_slug(self, index):
+        return f'dataset-{index % self._datasets}'
+
+    def _dataset_title(self, index):
+        return f'Dataset {index % self._datasets}'
+
+    def _export(self):
+        return OpendataExport({'X-API-KEY': _API_KEY}, self._portal.url)
+
+    @staticmethod
+    def _resource_arguments(**kwargs):
+        arguments = {field: None for field in _RESOURCE_FIELDS}
+        arguments.update(auth=_API_KEY, compute_checksum=None, misp_auth=None, **kwargs)
+        return Namespace(**arguments)
+
+    @staticmethod
+    def _search_arguments(**kwargs):
+        arguments = {
+            'auth': None, 'dataset_id': None, 'dataset_slug': None, 'dataset_title': None,
+            'resource_id': None, 'resource_title': None, 'page_size': 50, 'stream': False, 'fields': None
+        }
+        arguments.update(kwargs)
+        return Namespace(**arguments)
+
+    def _submit(self, setup):
+        opendata_export = self._export()
+        opendata_export.load_query(setup, dict(_BODY), level='attributes', misp_url=_MISP_URL)
+        return opendata_export.submit_data()
+
+
+def _percentile(latencies, percentile):
+    return latencies[max(math.ceil(percentile / 100 * len(latencies)) - 1, 0)]
+
+
+def _timed(function, index):
+    start = time.perf_counter()
+    try:
+        failed = function(index) is False
+    except Exception:
+        failed = True
+    return time.perf_counter() - start, failed
+
+
+def run_scenario(function, operations, concurrency):
+    with open(os.devnull, 'wt') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(_timed, [function] * operations, range(operations)))
+        duration = time.perf_counter() - start
+    latencies = sorted(latency * 1000 for latency, _ in results)
+    statistics = {
+        'operations': operations,
+        'errors': sum(1 for _, failed in results if failed),
+        'duration': round(duration, 4),
+        'ops_per_sec': round(operations / duration, 2) if duration else None,
+        'latency_ms': {'mean': round(sum(latencies) / len(latencies), 3), 'max': round(latencies[-1], 3)}
+    }
+    statistics['latency_ms'].update(
+        (f'p{percentile}', round(_percentile(latencies, percentile), 3)) for percentile in _PERCENTILES
+    )
+    return statistics
+
+
+def compare_results(results, baseline, threshold):
+    regressions = []
+    for name, statistics in results['scenarios'].items():
+        reference = baseline.get('scenarios', {}).get(name)
+        if reference is None:
+            continue
+        if reference['ops_per_sec'] and statistics['ops_per_sec'] < reference['ops_per_sec'] * (1 - threshold):
+            regressions.append(f"{name}: {statistics['ops_per_sec']} ops/s (baseline: {reference['ops_per_sec']} ops/s)")
+        if statistics['latency_ms']['p95'] > reference['latency_ms']['p95'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {statistics['latency_ms']['p95']} ms (baseline: {reference['latency_ms']['p95']} ms)")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark opendata.py and submit_resource.py against a local mock portal.')
+    parser.add_argument('--operations', type=int, default=200, help='Number of operations for each scenario.')
+    parser.add_argument('--concurrency', type=int, default=8, help='Number of operations run concurrently.')
+    parser.add_argument('--datasets', type=int, default=20, help='Number of datasets in the mock portal.')
+    parser.add_argument('--resources', type=int, default=10, help='Number of resources in each dataset of the mock portal.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Fixed latency of the mock portal, in seconds.')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Maximum random latency added by the mock portal, in seconds.')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Ratio of queries answered with an error by the mock portal.')
+    parser.add_argument('--scenarios', nargs='+', help='Only run the scenarios starting with the given names.')
+    parser.add_argument('--output', default='benchmark_results.json', help='File to write the results to, in JSON format.')
+    parser.add_argument('--baseline', help='Previous results file to compare with.')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Relative degradation from the baseline reported as a regression.')
+    add_arguments(parser)
+    # The mock portal does not throttle queries, the limiter only applies if explicitly requested
+    parser.set_defaults(rate_limit=0)
+    args = parser.parse_args()
+    configure_from_arguments(args)
+
+    settings = {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'scenarios')}
+    results = {'timestamp': datetime.now().isoformat(), 'settings': settings, 'scenarios': {}}
+    with MockPortal(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                    datasets=args.datasets, resources=args.resources) as portal:
+        benchmark = Benchmark(portal, args.datasets)
+        for name, function in benchmark.scenarios:
+            if args.scenarios and not any(name.startswith(scenario) for scenario in args.scenarios):
+                continue
+            statistics = run_scenario(function, args.operations, args.concurrency)
+            results['scenarios'][name] = statistics
+            latency = statistics['latency_ms']
+            print(f"{name:<40} {statistics['ops_per_sec']:>9.1f} ops/s   p50 {latency['p50']:>8.2f} ms   p95 {latency['p95']:>8.2f} ms   p99 {latency['p99']:>8.2f} ms   errors {statistics['errors']}")
+    with open(args.output, 'wt', encoding='utf-8') as f:
+        f.write(json.dumps(results, indent=4))
+    print(f'Results written in {args.output}')
+    if args.baseline:
+        with open(args.baseline, 'rt', encoding='utf-8') as f:
+            regressions = compare_results(results, json.loads(f.read()), args.threshold)
+        if regressions:
+            print('Regressions compared to the baseline:\n - ' + '\n - '.join(regressions))
+            sys.exit(1)
+        print('No regression compared to the baseline.')
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import pathlib
+import re
+import sqlite3
+import threading
+import time
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from urllib.parse import unquote, urlsplit
+
+_ABSOLUTE_PATH = pathlib.Path(__file__).parent.absolute()
+_CACHE_PATH = _ABSOLUTE_PATH / '.cache' / 'metadata.sqlite'
+_CACHEABLE_PATH = re.compile(r'/datasets/(?P<dataset>[^/]+)(/resources/[^/]+)?/?$')
+_DATASET_SEGMENT = re.compile(r'/datasets/(?P<dataset>[^/]+)')
+_SCHEMA = '''CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    dataset_id TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+)'''
+
+
+class MetadataCache():
+    """On-disk cache of the dataset & resource documents, revalidated with conditional GETs."""
+    def __init__(self, path=_CACHE_PATH, ttl=60, max_entries=1000):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        # The cache can be rebuilt at any time, durability is traded for cheaper writes
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=OFF')
+        with self._connection:
+            self._connection.execute(_SCHEMA)
+
+    @staticmethod
+    def _key(url):
+        parsed = urlsplit(url)
+        return f'{parsed.scheme}://{parsed.netloc}{unquote(parsed.path).rstrip("/")}'
+
+    @staticmethod
+    def is_cacheable(url, headers):
+        # Authenticated queries (me/, owner listings) are user dependant and never cached
+        if headers and any(header.lower() == 'x-api-key' for header in headers):
+            return False
+        parsed = urlsplit(url)
+        return not parsed.query and _CACHEABLE_PATH.search(parsed.path) is not None
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def get(self, url, send):
+        key = self._key(url)
+        with self._lock:
+            entry = self._connection.execute(
+                'SELECT etag, last_modified, headers, body, fetched_at FROM metadata WHERE key = ?', (key,)
+            ).fetchone()
+        if entry is not None:
+            etag, last_modified, headers, body, fetched_at = entry
+            if time.time() - fetched_at < self._ttl:
+                self._touch(key, refresh=False)
+                return self._build_response(url, headers, body)
+            if etag is None and last_modified is None:
+                self._evict(key)
+                entry = None
+        conditional = {}
+        if entry is not None:
+            if etag is not None:
+                conditional['If-None-Match'] = etag
+            if last_modified is not None:
+                conditional['If-Modified-Since'] = last_modified
+        response = send(conditional)
+        if response.status_code == 304 and entry is not None:
+            self._touch(key, refresh=True)
+            return self._build_response(url, headers, body)
+        if response.status_code == 200:
+            self._store(key, url, response)
+        elif entry is not None:
+            self._evict(key)
+        return response
+
+    def invalidate(self, url):
+        match = _DATASET_SEGMENT.search(unquote(urlsplit(url).path))
+        if match is None:
+            return
+        dataset = match.group('dataset')
+        with self._lock, self._connection:
+            identifiers = {dataset}
+            identifiers.update(
+                dataset_id for dataset_id, in self._connection.execute(
+                    'SELECT dataset_id FROM metadata WHERE dataset = ? AND dataset_id IS NOT NULL', (dataset,)
+                )
+            )
+            aliases = set(identifiers)
+            for identifier in identifiers:
+                aliases.update(
+                    alias for alias, in self._connection.execute(
+                        'SELECT dataset FROM metadata WHERE dataset_id = ?', (identifier,)
+                    )
+                )
+            placeholders = ', '.join('?' for _ in aliases)
+            self._connection.execute(
+                f'DELETE FROM metadata WHERE dataset IN ({placeholders}) OR dataset_id IN ({placeholders})',
+                tuple(aliases) * 2
+            )
+
+    @staticmethod
+    def _build_response(url, headers, body):
+        response = Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = url
+        response.headers = CaseInsensitiveDict(json.loads(headers))
+        response.encoding = 'utf-8'
+        response._content = body
+        return response
+
+    def _evict(self, key):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM metadata WHERE key = ?', (key,))
+
+    def _store(self, key, url, response):
+        dataset = _CACHEABLE_PATH.search(unquote(urlsplit(url).path)).group('dataset')
+        try:
+            content = response.json()
+        except ValueError:
+            return
+        dataset_id = content.get('id') if isinstance(content, dict) and 'resources' in content else None
+        now = time.time()
+        headers = {header: value for header, value in response.headers.items() if header.lower() in ('content-type', 'etag', 'last-modified')}
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, dataset, dataset_id, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                 json.dumps(headers), response.content, now, now)
+            )
+            self._connection.execute(
+                'DELETE FROM metadata WHERE key NOT IN (SELECT key FROM metadata ORDER BY accessed_at DESC LIMIT ?)',
+                (self._max_entries,)
+            )
+
+    def _touch(self, key, refresh):
+        now = time.time()
+        with self._lock, self._connection:
+            if refresh:
+                self._connection.execute('UPDATE metadata SET fetched_at = ?, accessed_at = ? WHERE key = ?', (now, now, key))
+            else:
+                self._connection.execute('UPDATE metadata SET accessed_at = ? WHERE key = ?', (now, key))
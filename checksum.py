@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import hashlib
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from transport import get_misp_session
+
+CHECKSUM_TYPES = (
+    'md5',
+    'sha1',
+    'sha256'
+)
+_CHUNK_SIZE = 1024 * 1024
+
+
+def misp_headers(misp_auth):
+    if misp_auth is None:
+        return None
+    return {'Authorization': misp_auth, 'Accept': 'application/json'}
+
+
+def stream_checksum(url, checksum_type='sha256', headers=None, chunk_size=_CHUNK_SIZE, display=print):
+    """Download the content behind `url` chunk by chunk to compute its checksum, size and mime type.
+
+    Returns the corresponding resource fields, or None if the content cannot be fetched.
+    """
+    hasher = hashlib.new(checksum_type)
+    filesize = 0
+    try:
+        with get_misp_session(url).get(url, headers=headers, stream=True) as response:
+            if response.status_code != 200:
+                display(f'/!\\ Unable to compute the checksum of {url}. /!\\ \n{response.status_code} - {response.reason}')
+                return None
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                hasher.update(chunk)
+                filesize += len(chunk)
+            mime_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+    except requests.RequestException as error:
+        display(f'/!\\ Unable to compute the checksum of {url}. /!\\ \n{error}')
+        return None
+    fields = {'checksum': {'type': checksum_type, 'value': hasher.hexdigest()}, 'filesize': filesize}
+    if mime_type:
+        fields['mime_type'] = mime_type
+    return fields
+
+
+def compute_checksums(urls, checksum_type='sha256', headers=None, workers=4, display=print):
+    """Stream several urls concurrently, returning their resource fields in the same order."""
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        return list(executor.map(lambda url: stream_checksum(url, checksum_type, headers=headers, display=display), urls))
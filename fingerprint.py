@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pathlib
+import sqlite3
+import threading
+import time
+
+_ABSOLUTE_PATH = pathlib.Path(__file__).parent.absolute()
+_FINGERPRINTS_PATH = _ABSOLUTE_PATH / '.cache' / 'fingerprints.sqlite'
+_LOCK = threading.Lock()
+_SCHEMA = '''CREATE TABLE IF NOT EXISTS fingerprints (
+    portal TEXT NOT NULL,
+    url TEXT NOT NULL,
+    checksum_type TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    filesize INTEGER,
+    published_at REAL NOT NULL,
+    PRIMARY KEY (portal, url)
+)'''
+_STORES = {}
+
+
+class FingerprintStore():
+    """Checksum of the content last published for each resource url, on each portal."""
+    def __init__(self, path=_FINGERPRINTS_PATH):
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        with self._connection:
+            self._connection.execute(_SCHEMA)
+
+    def get(self, portal, url):
+        with self._lock:
+            fingerprint = self._connection.execute(
+                'SELECT checksum_type, checksum FROM fingerprints WHERE portal = ? AND url = ?', (portal, url)
+            ).fetchone()
+        if fingerprint is not None:
+            return {'type': fingerprint[0], 'value': fingerprint[1]}
+
+    def set(self, portal, url, checksum, filesize=None):
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?)',
+                (portal, url, checksum['type'], checksum['value'], filesize, time.time())
+            )
+
+
+def get_store(path=_FINGERPRINTS_PATH):
+    with _LOCK:
+        if path not in _STORES:
+            _STORES[path] = FingerprintStore(path)
+        return _STORES[path]
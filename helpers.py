@@ -1,34 +1,188 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import codecs
+import json
+import re
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from portals import get_adapter
+from transport import get_session
+from typing import Callable, Iterator
 
-_API_URL = 'https://data.public.lu/api/1/'
+_PORTAL_URL = 'https://data.public.lu/'
+_API_URL = get_adapter(_PORTAL_URL).api_url
+_CHUNK_SIZE = 64 * 1024
+_PAGE_SIZE = 50
+_STRUCTURAL_CHARACTERS = re.compile(r'[][{}":,\\]')
+_SEPARATORS = re.compile(r'[\s,]*')
 
 
-def _filter_resources(datasets: list, value: str, feature: str) -> list:
-    for dataset in datasets:
-        if dataset[feature] == value:
-            return dataset['resources']
+class _ResourcesParser():
+    """Incremental parser of a dataset document, yielding the items of its top-level `resources` list.
+
+    The fields preceding the list are only scanned to locate it, and each resource is decoded
+    as soon as it is complete, so the document is never held entirely in memory.
+    """
+    def __init__(self):
+        self._buffer = ''
+        self._decoder = json.JSONDecoder()
+        self._depth = 0
+        self._in_string = False
+        self._key = None
+        self._position = 0
+        self._state = 'scanning'
+        self._string_start = 0
+
+    def feed(self, text: str) -> Iterator[dict]:
+        self._buffer = f'{self._buffer[self._position:]}{text}'
+        self._string_start -= self._position
+        self._position = 0
+        if self._state == 'scanning':
+            self._scan()
+        if self._state == 'resources':
+            yield from self._decode()
+
+    def _decode(self) -> Iterator[dict]:
+        while True:
+            self._position = _SEPARATORS.match(self._buffer, self._position).end()
+            if self._position == len(self._buffer):
+                return
+            if self._buffer[self._position] == ']':
+                self._state = 'done'
+                return
+            try:
+                resource, self._position = self._decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                # Incomplete resource, waiting for the next chunk
+                return
+            yield resource
+
+    def _scan(self):
+        position = self._position
+        while True:
+            match = _STRUCTURAL_CHARACTERS.search(self._buffer, position)
+            if match is None:
+                self._position = len(self._buffer) if not self._in_string else self._string_start
+                return
+            character = match.group()
+            position = match.end()
+            if self._in_string:
+                if character == '\\':
+                    if position == len(self._buffer):
+                        # Escaped character in the next chunk
+                        self._position = self._string_start
+                        return
+                    position += 1
+                elif character == '"':
+                    self._in_string = False
+                    self._key = self._buffer[self._string_start:match.start()] if self._depth == 1 else None
+                continue
+            if character == '"':
+                self._in_string = True
+                self._string_start = position
+            elif character in '{[':
+                self._depth += 1
+                if character == '[' and self._depth == 2 and self._key == 'resources':
+                    self._position = position
+                    self._state = 'resources'
+                    return
+            elif character in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._position = position
+                    self._state = 'done'
+                    return
+            elif character == ',':
+                self._key = None
+
+
+def _fetch_page(url: str, headers: dict, params: dict, display: Callable=print):
+    response = get_session(url).get(url, headers=headers, params=params)
+    if response.status_code != 200:
+        display(f'An error during your query to "{response.url}" has been raised: {response.status_code} - {response.reason}\n{response.text}')
+        return [], None
+    page = response.json()
+    if isinstance(page, list):
+        return page, None
+    return page['data'], page.get('next_page')
+
+
+def iterate_pages(url: str, headers: dict=None, page_size: int=_PAGE_SIZE, display: Callable=print) -> Iterator[dict]:
+    """Yield the items of a listing one page at a time, following the next_page links.
+
+    The next page is fetched in the background while the current one is consumed,
+    and nothing more is fetched once the caller stops iterating. The errors met are
+    passed to `display`.
+    """
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        # Pages as large as the portal accepts, to send as few queries as possible
+        items, next_page = _fetch_page(url, headers, {'page_size': get_adapter(url).page_size(page_size)}, display)
+        while True:
+            prefetch = executor.submit(_fetch_page, next_page, headers, None, display) if next_page else None
+            yield from items
+            if prefetch is None:
+                return
+            items, next_page = prefetch.result()
+    finally:
+        executor.shutdown(wait=False)
+
+
+def iterate_resources(response: requests.Response, chunk_size: int=_CHUNK_SIZE) -> Iterator[dict]:
+    """Yield the resources of a dataset from a streamed response, as they are received."""
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')()
+    parser = _ResourcesParser()
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        yield from parser.feed(decoder.decode(chunk))
+    yield from parser.feed(decoder.decode(b'', final=True))
+
+
+def parse_fields(fields: str=None) -> tuple:
+    if not fields:
+        return None
+    return tuple(field.strip() for field in fields.split(',') if field.strip())
+
+
+def project(item: dict, fields: tuple=None) -> dict:
+    if not fields:
+        return item
+    return {field: item[field] for field in fields if field in item}
+
+
+def set_portal(portal_url: str):
+    global _API_URL
+    _API_URL = get_adapter(portal_url).api_url
 
 
 def get_me(headers: dict) -> dict:
-    me = requests.get(f'{_API_URL}me', headers=headers)
+    me = get_session(_API_URL).get(f'{_API_URL}me', headers=headers)
     return me.json()
 
 
-def get_my_datasets(headers: dict) -> list:
+def iterate_my_datasets(headers: dict, page_size: int=_PAGE_SIZE) -> Iterator[dict]:
     me = get_me(headers)
     if len(me) == 1 and 'message' in me:
         print(f'An error during your query to "{_API_URL}me" has been raised: {me["message"]}')
         return
-    my_datasets = requests.get(f'{_API_URL}datasets/?owner={me["id"]}')
-    return my_datasets.json()['data']
+    yield from iterate_pages(f'{_API_URL}datasets/?owner={me["id"]}', page_size=page_size)
 
 
-def get_resources(headers: dict, id: str=None, slug: str=None) -> list:
+def get_my_datasets(headers: dict, page_size: int=_PAGE_SIZE) -> list:
+    return list(iterate_my_datasets(headers, page_size=page_size))
+
+
+def get_resources(headers: dict, id: str=None, slug: str=None, page_size: int=_PAGE_SIZE) -> list:
     if id is None and slug is None:
         print('Please define an identifier (id or slug field) for the dataset you want to get the resources about.')
         return
-    my_datasets = get_my_datasets(headers)
-    return _filter_resources(my_datasets, id, 'id') if id is not None else _filter_resources(my_datasets, slug, 'slug')
+    # The dataset is fetched directly, while checking that it is one of yours
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        me = executor.submit(get_me, headers)
+        dataset = executor.submit(get_session(_API_URL).get, f'{_API_URL}datasets/{id if id is not None else slug}/')
+        me, dataset = me.result(), dataset.result()
+    if len(me) == 1 and 'message' in me:
+        print(f'An error during your query to "{_API_URL}me" has been raised: {me["message"]}')
+        return
+    if dataset.status_code == 200 and (dataset.json().get('owner') or {}).get('id') == me['id']:
+        return dataset.json()['resources']
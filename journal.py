@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import pathlib
+import threading
+import time
+from portals import get_adapter
+from resolver import get_index
+from transport import get_session
+
+_ABSOLUTE_PATH = pathlib.Path(__file__).parent.absolute()
+_JOURNAL_PATH = _ABSOLUTE_PATH / '.cache' / 'journal.jsonl'
+
+
+class Journal():
+    """Append-only record of the operations of a batch run, written before and after each of them.
+
+    A new run starts a new journal. A resumed run reads the journal of the interrupted one,
+    skips the operations that completed successfully and appends the outcome of the others.
+    """
+    def __init__(self, path=_JOURNAL_PATH, resume=False):
+        self._path = pathlib.Path(path)
+        self._lock = threading.Lock()
+        self._completed = {}
+        self._results = {}
+        self._started = {}
+        terminated = self._load() if resume else True
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self._path, 'at' if resume else 'wt', encoding='utf-8')
+        if not terminated:
+            # Keeps the partially written record apart from the next ones
+            self._file.write('\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def key(portal_url, index, entry):
+        content = json.dumps([portal_url, index, entry], sort_keys=True)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    @property
+    def interrupted(self):
+        # Operations started during the previous run whose outcome has never been recorded
+        return [record for key, record in self._started.items() if key not in self._completed]
+
+    def begin(self, key, index, action, name, portal_url, dataset):
+        self._write(
+            {
+                'operation': 'begin', 'key': key, 'index': index, 'action': action,
+                'name': name, 'portal_url': portal_url, 'dataset': dataset
+            }
+        )
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def complete(self, key, status, result=None):
+        self._write({'operation': 'complete', 'key': key, 'status': bool(status), 'result': result})
+
+    def is_completed(self, key):
+        return self._completed.get(key, False)
+
+    def previous_result(self, key):
+        """Result of the last attempt of an operation started by a previous run ({} if unknown), None if it is a new one."""
+        if key not in self._started:
+            return None
+        return self._results.get(key) or {}
+
+    ################################################################################
+    #                              UTILITY FUNCTIONS                               #
+    ################################################################################
+
+    def _load(self):
+        line = '\n'
+        try:
+            with open(self._path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Last record partially written when the run was interrupted
+                        continue
+                    if record['operation'] == 'begin':
+                        self._started[record['key']] = record
+                    else:
+                        self._completed[record['key']] = record['status']
+                        self._results[record['key']] = record.get('result')
+        except FileNotFoundError:
+            pass
+        return line.endswith('\n')
+
+    def _write(self, record):
+        record['time'] = time.time()
+        line = f'{json.dumps(record)}\n'
+        with self._lock:
+            self._file.write(line)
+            # Flushed right away so that the record survives the process being killed
+            self._file.flush()
+
+
+def open_journal(path, resume=False):
+    journal = Journal(path, resume=resume)
+    if resume:
+        interrupted = journal.interrupted
+        for record in interrupted:
+            # A write may have reached the portal before the interruption, the next operations must see it
+            session = get_session(record['portal_url'])
+            if session.cache is None or record['dataset'] is None:
+                continue
+            api_url = get_adapter(record['portal_url']).api_url
+            # The cache is keyed by id or slug, the title is resolved with the index of the datasets already met
+            for identifier in {record['dataset'], *get_index().find(api_url, record['dataset'])}:
+                session.cache.invalidate(f'{api_url}datasets/{identifier}/')
+        if interrupted:
+            print(f'{len(interrupted)} operation(s) interrupted during the previous run will be checked against the portal again.')
+    return journal
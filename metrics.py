@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import atexit
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0
+)
+_FIXED_SEGMENTS = (
+    'api',
+    'datasets',
+    'me',
+    'org_datasets',
+    'resources',
+    'restSearch'
+)
+_PARAMETER_NAMES = {
+    'datasets': '{dataset}',
+    'resources': '{resource}'
+}
+
+
+class MetricsRegistry():
+    """Latency histograms & counters of the outbound queries, plus the duration of the main phases of a run."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._phases = {}
+
+    def record_phase(self, name, duration):
+        with self._lock:
+            self._phases[name] = self._phases.get(name, 0) + duration
+
+    def record_request(self, url, method, status, duration, bytes_sent=0, bytes_received=0, retries=0):
+        parsed = urlsplit(url)
+        key = (f'{parsed.scheme}://{parsed.netloc}', method.upper(), endpoint_template(url), str(status))
+        with self._lock:
+            if key not in self._requests:
+                self._requests[key] = {
+                    'buckets': [0] * (len(_BUCKETS) + 1), 'count': 0, 'sum': 0.0,
+                    'bytes_sent': 0, 'bytes_received': 0, 'retries': 0
+                }
+            statistics = self._requests[key]
+            statistics['buckets'][_bucket_index(duration)] += 1
+            statistics['count'] += 1
+            statistics['sum'] += duration
+            statistics['bytes_sent'] += bytes_sent
+            statistics['bytes_received'] += bytes_received
+            statistics['retries'] += retries
+
+    def to_json(self):
+        with self._lock:
+            requests = []
+            for (portal, method, endpoint, status), statistics in sorted(self._requests.items()):
+                cumulative = 0
+                buckets = {}
+                for bound, count in zip(_BUCKETS + ('+Inf',), statistics['buckets']):
+                    cumulative += count
+                    buckets[str(bound)] = cumulative
+                requests.append(
+                    {
+                        'portal': portal, 'method': method, 'endpoint': endpoint, 'status': status,
+                        'count': statistics['count'], 'sum': round(statistics['sum'], 6), 'buckets': buckets,
+                        'bytes_sent': statistics['bytes_sent'], 'bytes_received': statistics['bytes_received'],
+                        'retries': statistics['retries']
+                    }
+                )
+            phases = {name: round(duration, 6) for name, duration in self._phases.items()}
+        return {'requests': requests, 'phases': phases}
+
+    def to_prometheus(self):
+        content = self.to_json()
+        lines = [
+            '# HELP opendata_request_duration_seconds Duration of the queries sent to the portals.',
+            '# TYPE opendata_request_duration_seconds histogram'
+        ]
+        counters = []
+        for request in content['requests']:
+            labels = ','.join(f'{label}="{request[label]}"' for label in ('portal', 'method', 'endpoint', 'status'))
+            for bound, count in request['buckets'].items():
+                lines.append(f'opendata_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f"opendata_request_duration_seconds_sum{{{labels}}} {request['sum']}")
+            lines.append(f"opendata_request_duration_seconds_count{{{labels}}} {request['count']}")
+            counters.extend((name, labels, request[name]) for name in ('bytes_sent', 'bytes_received', 'retries'))
+        for name in ('bytes_sent', 'bytes_received', 'retries'):
+            lines.append(f'# TYPE opendata_request_{name}_total counter')
+            lines.extend(f'opendata_request_{name}_total{{{labels}}} {value}' for counter, labels, value in counters if counter == name)
+        lines.append('# TYPE opendata_phase_duration_seconds gauge')
+        lines.extend(f'opendata_phase_duration_seconds{{phase="{name}"}} {duration}' for name, duration in content['phases'].items())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def _bucket_index(duration):
+    for index, bound in enumerate(_BUCKETS):
+        if duration <= bound:
+            return index
+    return len(_BUCKETS)
+
+
+def _process_uptime():
+    # Time elapsed since the process started, including the interpreter startup (Linux only)
+    try:
+        with open('/proc/self/stat', 'rt') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime', 'rt') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (AttributeError, IndexError, OSError, ValueError):
+        return None
+
+
+def _write_outputs(args, profiler):
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+    if args.metrics_out:
+        metrics_format = args.metrics_format
+        if metrics_format is None:
+            metrics_format = 'prometheus' if args.metrics_out.endswith(('.prom', '.txt')) else 'json'
+        with open(args.metrics_out, 'wt', encoding='utf-8') as f:
+            f.write(REGISTRY.to_prometheus() if metrics_format == 'prometheus' else json.dumps(REGISTRY.to_json(), indent=4))
+
+
+def add_arguments(parser):
+    parser.add_argument('--metrics_out', help='File to write the timings of the queries sent to the portal and of the main steps to.')
+    parser.add_argument('--metrics_format', choices=('json', 'prometheus'), help='Format of the metrics file (guessed from its extension if not set).')
+    parser.add_argument('--profile', help='File to write a cProfile dump of the whole run to (readable with pstats or snakeviz).')
+
+
+def endpoint_template(url):
+    path = urlsplit(url).path
+    if '/api/1/' in path:
+        path = path.split('/api/1/', 1)[1]
+    segments = []
+    previous = None
+    for segment in path.strip('/').split('/'):
+        if segment in _FIXED_SEGMENTS or not segment:
+            segments.append(segment)
+        else:
+            segments.append(_PARAMETER_NAMES.get(previous, '{parameter}'))
+        previous = segment
+    return '/'.join(segments) + '/'
+
+
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.record_phase(name, time.perf_counter() - start)
+
+
+def setup(args):
+    """Start the profiler if requested and write the metrics & profile when the process exits."""
+    uptime = _process_uptime()
+    if uptime is not None:
+        REGISTRY.record_phase('startup', uptime)
+    profiler = None
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    if args.metrics_out or profiler is not None:
+        atexit.register(_write_outputs, args, profiler)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+_ATTRIBUTES_PER_CHUNK = 100
+_LIMIT = re.compile(r'/limit:(?P<limit>\d+)')
+
+
+def _attribute(namespace, index):
+    return {
+        'id': str(index),
+        'event_id': str(index // 10),
+        'uuid': str(uuid.uuid5(namespace, str(index))),
+        'category': 'Network activity',
+        'type': 'ip-dst',
+        'value': f'198.51.{(index >> 8) & 255}.{index & 255}',
+        'to_ids': True,
+        'timestamp': str(1600000000 + index),
+        'comment': f'Mock attribute number {index}',
+        'Tag': [{'name': 'tlp:white'}]
+    }
+
+
+class _MISPHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    attributes = 1000
+    auth_key = None
+    latency = 0.0
+    jitter = 0.0
+    throughput = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    ################################################################################
+    #                                   ROUTING                                    #
+    ################################################################################
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        path = unquote(urlsplit(self.path).path)
+        if '/restSearch' not in path:
+            return self._send_error(404, 'Not found')
+        if self.auth_key is not None and self.headers.get('Authorization') != self.auth_key:
+            return self._send_error(403, 'Authentication failed')
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        limit = _LIMIT.search(path)
+        count = int(limit.group('limit')) if limit is not None else self.attributes
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        # The same query always returns the same content
+        namespace = uuid.uuid5(uuid.NAMESPACE_URL, path)
+        self._write_chunk(b'{"response": {"Attribute": [')
+        for start in range(0, count, _ATTRIBUTES_PER_CHUNK):
+            attributes = ',\n'.join(
+                json.dumps(_attribute(namespace, index)) for index in range(start, min(start + _ATTRIBUTES_PER_CHUNK, count))
+            )
+            chunk = f"{',' if start else ''}\n{attributes}".encode()
+            if self.throughput:
+                time.sleep(len(chunk) / self.throughput)
+            self._write_chunk(chunk)
+        self._write_chunk(b'\n]}}')
+        self._write_chunk(b'')
+
+    ################################################################################
+    #                              UTILITY FUNCTIONS                               #
+    ################################################################################
+
+    def _send_error(self, status, message):
+        body = json.dumps({'name': message, 'message': message, 'url': self.path}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, chunk):
+        self.wfile.write(f'{len(chunk):X}\r\n'.encode() + chunk + b'\r\n')
+
+
+class MockMISP():
+    """Local stand-in for the MISP restSearch endpoints, returning generated attributes."""
+    def __init__(self, host='127.0.0.1', port=0, attributes=1000, auth_key=None, latency=0.0, jitter=0.0, throughput=0.0):
+        handler = type(
+            'MISPHandler', (_MISPHandler,),
+            {
+                'attributes': attributes, 'auth_key': auth_key, 'latency': latency,
+                'jitter': jitter, 'throughput': throughput
+            }
+        )
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a local stand-in of the MISP restSearch API.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=8081, help='Port to listen on.')
+    parser.add_argument('--attributes', type=int, default=1000, help='Number of attributes returned by the queries without limit filter.')
+    parser.add_argument('--auth_key', help='API key expected in the Authorization header (no authentication if not set).')
+    parser.add_argument('--latency', type=float, default=0.0, help='Fixed delay before the first byte of each response, in seconds.')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Maximum random delay added on top of the fixed one, in seconds.')
+    parser.add_argument('--throughput', type=float, default=0.0, help='Maximum number of bytes per second sent for each response (0 for no limit).')
+    args = parser.parse_args()
+    misp = MockMISP(
+        args.host, args.port, attributes=args.attributes, auth_key=args.auth_key,
+        latency=args.latency, jitter=args.jitter, throughput=args.throughput
+    )
+    print(f'Mock MISP listening on {misp.url}')
+    try:
+        misp.serve_forever()
+    except KeyboardInterrupt:
+        misp.stop()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import email.policy
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlencode, urlsplit
+
+_MAX_PAGE_SIZE = 100
+_OWNER_ID = 'mock-user'
+_PAGE_SIZE = 20
+
+
+class PortalState():
+    """In-memory datasets & resources of the mock portal."""
+    def __init__(self, datasets=0, resources=0):
+        self.lock = threading.RLock()
+        self.datasets = {}
+        self.files = {}
+        for index in range(datasets):
+            self.create_dataset(
+                {
+                    'title': f'Dataset {index}',
+                    'description': f'Mock dataset number {index}.',
+                    'resources': [
+                        {
+                            'title': f'Resource {number}',
+                            'type': 'main',
+                            'format': 'json',
+                            'filetype': 'remote',
+                            'url': f'https://misp.local/attributes/restSearch/tags:mock-{index}-{number}'
+                        } for number in range(resources)
+                    ]
+                }
+            )
+
+    def create_dataset(self, dataset):
+        now = datetime.now().isoformat()
+        dataset = dict(dataset)
+        dataset['id'] = uuid.uuid4().hex
+        dataset.setdefault('slug', '-'.join(dataset['title'].lower().strip().split(' ')))
+        dataset.update({'owner': {'id': _OWNER_ID}, 'created_at': now, 'last_modified': now})
+        dataset['resources'] = [self.create_resource(resource) for resource in dataset.get('resources', [])]
+        with self.lock:
+            self.datasets[dataset['id']] = dataset
+        return dataset
+
+    @staticmethod
+    def create_resource(resource):
+        resource = dict(resource)
+        resource['id'] = uuid.uuid4().hex
+        resource['last_modified'] = datetime.now().isoformat()
+        return resource
+
+    def find(self, identifier):
+        with self.lock:
+            if identifier in self.datasets:
+                return self.datasets[identifier]
+            # Like udata, by id or slug only
+            for dataset in self.datasets.values():
+                if dataset['slug'] == identifier:
+                    return dataset
+
+
+class _PortalHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    state = None
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+    error_status = 500
+
+    def log_message(self, *args):
+        pass
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    ################################################################################
+    #                                   ROUTING                                    #
+    ################################################################################
+
+    def _handle(self, method):
+        parsed = urlsplit(self.path)
+        body = self._read_body()
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        if self.error_rate and random.random() < self.error_rate:
+            return self._send(self.error_status, {'message': 'Injected error'})
+        path = [unquote(part) for part in parsed.path.strip('/').split('/')]
+        if path[0] == 'files' and len(path) == 3 and method == 'GET':
+            return self._send_file(path[1])
+        if path[:2] != ['api', '1'] or len(path) < 3:
+            return self._send(404, {'message': 'Not found'})
+        path = path[2:]
+        if method != 'GET' and 'X-API-KEY' not in self.headers:
+            return self._send(401, {'message': 'Unauthorized'})
+        if path[0] == 'me':
+            return self._handle_me(path[1:])
+        if path[0] == 'datasets':
+            return self._handle_datasets(method, path[1:], parse_qs(parsed.query), body)
+        self._send(404, {'message': 'Not found'})
+
+    def _handle_datasets(self, method, path, query, body):
+        if not path:
+            if method == 'POST':
+                return self._send(201, self.state.create_dataset(body))
+            return self._send_page(query)
+        dataset = self.state.find(path[0])
+        if dataset is None:
+            return self._send(404, {'message': 'Dataset not found'})
+        if len(path) == 1:
+            if method == 'GET':
+                return self._send(200, dataset, conditional=True)
+            if method == 'PUT':
+                with self.state.lock:
+                    dataset.update({key: value for key, value in body.items() if key not in ('id', 'resources')})
+                    dataset['last_modified'] = datetime.now().isoformat()
+                    if 'resources' in body:
+                        # Like udata, the embedded list replaces the resources, keeping the ids it contains
+                        dataset['resources'] = [
+                            resource if resource.get('id') else self.state.create_resource(resource)
+                            for resource in body['resources']
+                        ]
+                return self._send(200, dataset)
+            with self.state.lock:
+                self.state.datasets.pop(dataset['id'], None)
+            return self._send(204)
+        if path[1:] == ['upload'] and method == 'POST':
+            return self._handle_upload(dataset)
+        if path[1] != 'resources':
+            return self._send(404, {'message': 'Not found'})
+        if len(path) == 2:
+            if method != 'POST':
+                return self._send(405, {'message': 'Method not allowed'})
+            resource = self.state.create_resource(body)
+            with self.state.lock:
+                dataset['resources'].append(resource)
+            return self._send(201, resource)
+        if path[3:] == ['upload'] and method == 'POST':
+            return self._handle_upload(dataset, path[2])
+        return self._handle_resource(method, dataset, path[2], body)
+
+    def _handle_me(self, path):
+        if 'X-API-KEY' not in self.headers:
+            return self._send(401, {'message': 'Unauthorized'})
+        if not path:
+            return self._send(200, {'id': _OWNER_ID, 'first_name': 'Mock', 'last_name': 'User', 'organizations': []})
+        if path[0] == 'datasets':
+            with self.state.lock:
+                datasets = [dataset for dataset in self.state.datasets.values() if dataset['owner']['id'] == _OWNER_ID]
+            return self._send(200, datasets)
+        if path[0] == 'org_datasets':
+            return self._send(200, [])
+        self._send(404, {'message': 'Not found'})
+
+    def _handle_upload(self, dataset, resource_id=None):
+        message = BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {self.headers.get('Content-Type', '')}\r\n\r\n".encode() + self._raw_body
+        )
+        upload = next((part for part in message.iter_parts() if part.get_param('name', header='content-disposition') == 'file'), None)
+        if upload is None:
+            return self._send(400, {'message': 'No file uploaded'})
+        filename = upload.get_filename()
+        content = upload.get_payload(decode=True)
+        file_id = uuid.uuid4().hex
+        fields = {
+            'filetype': 'file', 'format': filename.rsplit('.', 1)[-1], 'filesize': len(content),
+            'url': f"http://{self.headers['Host']}/files/{file_id}/{filename}",
+            'checksum': {'type': 'sha1', 'value': hashlib.sha1(content).hexdigest()}
+        }
+        with self.state.lock:
+            self.state.files[file_id] = content
+            if resource_id is None:
+                resource = self.state.create_resource(dict(fields, title=filename, type='main'))
+                dataset['resources'].append(resource)
+                return self._send(201, resource)
+            for resource in dataset['resources']:
+                if resource['id'] == resource_id:
+                    resource.update(fields)
+                    resource['last_modified'] = datetime.now().isoformat()
+                    return self._send(200, resource)
+        self._send(404, {'message': 'Resource not found'})
+
+    def _handle_resource(self, method, dataset, resource_id, body):
+        with self.state.lock:
+            for index, resource in enumerate(dataset['resources']):
+                if resource['id'] == resource_id:
+                    break
+            else:
+                return self._send(404, {'message': 'Resource not found'})
+            if method == 'DELETE':
+                dataset['resources'].pop(index)
+                return self._send(204)
+            if method == 'PUT':
+                resource.update({key: value for key, value in body.items() if key != 'id'})
+                resource['last_modified'] = datetime.now().isoformat()
+        self._send(200, resource, conditional=method == 'GET')
+
+    ################################################################################
+    #                              UTILITY FUNCTIONS                               #
+    ################################################################################
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self._raw_body = self.rfile.read(length) if length else b''
+        if not length or self.headers.get_content_type() == 'multipart/form-data':
+            return {}
+        try:
+            return json.loads(self._raw_body)
+        except ValueError:
+            return {}
+
+    def _send(self, status, content=None, conditional=False):
+        with self.state.lock:
+            body = b'' if content is None else json.dumps(content).encode()
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        if conditional and self.headers.get('If-None-Match') == etag:
+            status, body = 304, b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if conditional:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_file(self, file_id):
+        with self.state.lock:
+            content = self.state.files.get(file_id)
+        if content is None:
+            return self._send(404, {'message': 'File not found'})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_page(self, query):
+        owner = query.get('owner', [None])[0]
+        organization = query.get('organization', [None])[0]
+        search = query.get('q', [''])[0].lower()
+        page = int(query.get('page', ['1'])[0])
+        page_size = min(int(query.get('page_size', [str(_PAGE_SIZE)])[0]), _MAX_PAGE_SIZE)
+        with self.state.lock:
+            datasets = [
+                dataset for dataset in self.state.datasets.values()
+                if (owner is None or dataset['owner']['id'] == owner)
+                and (organization is None or (dataset.get('organization') or {}).get('id') == organization)
+                and search in dataset['title'].lower()
+            ]
+        if query.get('sort', [None])[0] == '-last_modified':
+            datasets.sort(key=lambda dataset: dataset['last_modified'], reverse=True)
+        start = (page - 1) * page_size
+        next_page = None
+        if start + page_size < len(datasets):
+            filters = {key: values[0] for key, values in query.items() if key not in ('page', 'page_size')}
+            next_page = f"http://{self.headers['Host']}/api/1/datasets/?{urlencode(dict(filters, page=page + 1, page_size=page_size))}"
+        self._send(
+            200,
+            {
+                'data': datasets[start:start + page_size],
+                'page': page,
+                'page_size': page_size,
+                'total': len(datasets),
+                'next_page': next_page
+            }
+        )
+
+
+class MockPortal():
+    """Local stand-in for the udata `api/1/` endpoints used by this project."""
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, error_status=500, datasets=0, resources=0):
+        self.state = PortalState(datasets, resources)
+        handler = type(
+            'PortalHandler', (_PortalHandler,),
+            {
+                'state': self.state, 'latency': latency, 'jitter': jitter,
+                'error_rate': error_rate, 'error_status': error_status
+            }
+        )
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a local stand-in of the udata API used by the open data portals.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Fixed latency added to each query, in seconds.')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Maximum random latency added on top of the fixed one, in seconds.')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Ratio of queries answered with an error.')
+    parser.add_argument('--error_status', type=int, default=500, help='Status code of the injected errors.')
+    parser.add_argument('--datasets', type=int, default=0, help='Number of datasets to create at startup.')
+    parser.add_argument('--resources', type=int, default=0, help='Number of resources in each of the datasets created at startup.')
+    args = parser.parse_args()
+    portal = MockPortal(
+        args.host, args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        error_status=args.error_status, datasets=args.datasets, resources=args.resources
+    )
+    print(f'Mock portal listening on {portal.url}')
+    try:
+        portal.serve_forever()
+    except KeyboardInterrupt:
+        portal.stop()
@@ -1,24 +1,89 @@
 import argparse
+import fnmatch
 import json
+import metrics
 import pathlib
+import portals
+import re
 import requests
 import sys
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from checksum import CHECKSUM_TYPES, compute_checksums, misp_headers, stream_checksum
 from datetime import datetime
+from fingerprint import get_store
+from helpers import iterate_resources, parse_fields, project
+from journal import open_journal
+from portals import find_portal, get_adapter, load_supported_portals
+from resolver import DatasetResolver
+from snapshot import COMPRESSIONS, mime_type, snapshot_settings, write_snapshot
+from transport import add_arguments, configure_from_arguments, get_session
 # from pymisp import ExpandedPyMISP, MISPAttribute, MISPEvent, MISPObject
 
 _ABSOLUTE_PATH = pathlib.Path(__file__).parent.absolute()
+_DELETE_WORKERS = 8
+_CONTENT_FIELDS = (
+    'checksum',
+    'filesize',
+    'last_modified',
+    'mime_type'
+)
+# Status codes of a portal refusing the resources embedded in a dataset payload
+_BULK_REJECTED_STATUSES = (
+    400,
+    405,
+    413,
+    422
+)
+# The other rejections may come from an invalid field of one resource rather than from the embedded resources
+_BULK_UNSUPPORTED_STATUSES = (
+    405,
+    413
+)
+_OWNERS = {}
+_RESOURCE_REQUIRED_FIELDS = (
+    'title',
+    'type',
+    'url',
+    'format'
+)
 
 
 class OpendataExport():
     def __init__(self, auth, url):
         self._auth = auth
         self._auth['Content-type'] = 'application/json'
-        self._api_url = f'{url}api/1/'
-        self._dataset_url = f'{url}en/datasets/'
+        self._adapter = get_adapter(url)
+        # Detected once per portal, the rate limits it advertises then apply to the session
+        self._adapter.load(display=self._display)
+        self._session = get_session(url)
+        self._api_url = self._adapter.api_url
+        self._dataset_url = self._adapter.dataset_url
+        self.checksum_type = None
+        self.incremental = False
+        self.misp_auth = None
+        self.owner = None
+        self.result = None
+        self.snapshot = None
+        self.workers = _DELETE_WORKERS
+
+    def load_query(self, setup, body, level='events', misp_url='https://misppriv.circl.lu', checksum_type=None, misp_auth=None, incremental=False, snapshot=None):
+        self.setup = setup
+        self.body = body
+        self.level = level
+        self.misp_url = misp_url
+        self.incremental = incremental
+        self.checksum_type = checksum_type if checksum_type is not None or not incremental else 'sha256'
+        self.misp_auth = misp_auth
+        self.snapshot = snapshot
 
     def parse_arguments(self, args):
         self.level = args.level
         self.misp_url = args.misp_url
+        self.incremental = args.incremental
+        self.checksum_type = args.checksum if args.checksum is not None or not args.incremental else 'sha256'
+        self.misp_auth = args.misp_auth
+        self.snapshot = snapshot_settings(args)
         recommandation = 'Please make sure the file exists and you have the right to open it.'
         for feature in ('body', 'setup'):
             filename = getattr(args, feature) if getattr(args, feature) is not None else f'{_ABSOLUTE_PATH}/{feature}.json'
@@ -26,46 +91,119 @@ class OpendataExport():
                 with open(filename, 'rt', encoding='utf-8') as f:
                     setattr(self, feature, json.loads(f.read()))
             except (FileNotFoundError, PermissionError):
-                print(f'/!\ The {feature} file specified ({filename}) cannot be opened. /!\ \n{recommandation}')
+                self._display(f'/!\ The {feature} file specified ({filename}) cannot be opened. /!\ \n{recommandation}')
                 sys.exit(0)
 
     ################################################################################
     #                            MAIN PARSING FUNCTIONS                            #
     ################################################################################
 
-    def delete_data(self, to_delete):
+    def delete_data(self, to_delete, previous=None):
+        """`previous` is the result of the same deletion started by a previous run, what it found & cannot be found anymore has been deleted."""
         if len(to_delete) == 1:
-            self._send_delete_request(to_delete[0], to_delete[0])
-        else:
-            dataset = to_delete[0]
-            resources = to_delete[1:]
-            self._delete_resources(dataset, resources)
+            return self._send_delete_request(to_delete[0], to_delete[0], replay=previous is not None)
+        dataset = to_delete[0]
+        resources = to_delete[1:]
+        return self._delete_resources(dataset, resources, previous=previous)
 
     def search_data(self, to_search):
         if len(to_search) == 1:
-            self._search_dataset(to_search[0])
+            return self._search_dataset(to_search[0])
+        dataset = to_search[0]
+        resources = to_search[1:]
+        return self._search_resources(dataset, resources)
+
+    def stream_search(self, to_search, fields=None):
+        """Display the resources of a dataset as compact JSON lines, as soon as they are received.
+
+        Only the resources matching the titles or ids following the dataset identifier are
+        displayed (all of them if there is none), restricted to the given `fields`.
+        """
+        dataset_to_search = to_search[0]
+        wanted = set(to_search[1:])
+        found = set()
+        with self._session.get(f'{self._api_url}datasets/{dataset_to_search}/', stream=True) as dataset:
+            if dataset.status_code != 200:
+                self._display(f'/!\\ The dataset {dataset_to_search} you are looking for has not been found. /!\\ \nStatus: {dataset.status_code} - {dataset.text}')
+                return False
+            for resource in iterate_resources(dataset):
+                if wanted:
+                    matches = wanted.intersection((resource.get('id'), resource.get('title')))
+                    if not matches:
+                        continue
+                    found.update(matches)
+                self._display(json.dumps(project(resource, fields), separators=(',', ':')))
+        self.result = {'not_found': [resource for resource in to_search[1:] if resource not in found]}
+        return not self.result['not_found']
+
+    def submit_bulk(self, queries, checksum_type=None, misp_auth=None, incremental=False):
+        """Create or update several resources of the same dataset with a single dataset-level write.
+
+        `queries` are the setup, body, level & misp_url passed to `load_query` for each
+        resource, sharing the same checksum settings. The existing resources keep their id.
+        Falls back to one query per resource if the portal rejects the resources embedded in
+        the dataset payload. Returns the status of each resource.
+        """
+        setups = []
+        for query in queries:
+            self.load_query(**query, checksum_type=checksum_type, misp_auth=misp_auth, incremental=incremental)
+            if not self.setup.get('resources') or not any(required in self.setup['resources'] for required in ('title', 'type')):
+                self._display('/!\\ Error with the resources required fields. /!\\')
+                self._display('Please make it contains the required fields: title, type')
+                setups.append(None)
+                continue
+            self._check_resources_fields(checksum=False)
+            setups.append(self.setup)
+        valid = [setup for setup in setups if setup is not None]
+        if not valid:
+            return [False] * len(setups)
+        if self.checksum_type is not None and self.snapshot is None:
+            # The restSearch results of the resources are downloaded & hashed concurrently
+            resources = [setup['resources'] for setup in valid]
+            checksums = compute_checksums(
+                [resource['url'] for resource in resources], self.checksum_type,
+                headers=misp_headers(self.misp_auth), workers=self.workers, display=self._display
+            )
+            for resource, fields in zip(resources, checksums):
+                if fields is not None:
+                    resource.update(fields)
+        self.setup = valid[0]
+        if self._get_owner() is None:
+            return [False] * len(setups)
+        dataset = self._find_dataset()
+        if dataset is not None:
+            published = self._update_resources_bulk(dataset, valid)
         else:
-            dataset = to_search[0]
-            resources = to_search[1:]
-            self._search_resources(dataset, resources)
+            self.setup['dataset']['slug'] = '-'.join(self.setup['dataset']['title'].lower().strip().split(' '))
+            self._check_dataset_fields()
+            self.setup['dataset']['resources'] = [setup['resources'] for setup in valid]
+            response = self._session.post(f'{self._api_url}datasets/', headers=self._auth, json=self.setup['dataset'])
+            created = self._handle_response('created', 'dataset', response, 201)
+            if created:
+                DatasetResolver(self._api_url).record(response.json())
+                for setup in valid:
+                    self._record_fingerprint(setup['resources'])
+            published = [created] * len(valid)
+        published = iter(published)
+        return [False if setup is None else next(published) for setup in setups]
 
     def submit_data(self):
         required_dataset_fields = ('title', 'description')
         required_resources_fields = ('title', 'type')
         for feature in ('dataset', 'resources'):
             if feature in self.setup and not any(required in self.setup[feature] for required in locals()[f'required_{feature}_fields']):
-                print(f'/!\ Error with the {feature} required fields. /!\\')
-                print(f'Please make it contains the required fields: {", ".join(locals()[f"required_{feature}_fields"])}')
-                return
-        dataset = requests.get(f"{self._api_url}datasets/{self.setup['dataset']['title']}")
-        if dataset.status_code == 200:
+                self._display(f'/!\ Error with the {feature} required fields. /!\\')
+                self._display(f'Please make it contains the required fields: {", ".join(locals()[f"required_{feature}_fields"])}')
+                return False
+        if self._get_owner() is None:
+            return False
+        dataset = self._find_dataset()
+        if dataset is not None:
             if 'resources' in self.setup:
-                self._update_resources(dataset.json())
-            else:
-                self._update_dataset(dataset.json()['id'])
-        else:
-            self.setup['dataset']['slug'] = '-'.join(self.setup['dataset']['title'].lower().strip().split(' '))
-            self._create_dataset()
+                return self._update_resources(dataset)
+            return self._update_dataset(dataset['id'])
+        self.setup['dataset']['slug'] = '-'.join(self.setup['dataset']['title'].lower().strip().split(' '))
+        return self._create_dataset()
 
     ################################################################################
     #                          SPECIFIC PARSING FUNCTIONS                          #
@@ -76,48 +214,75 @@ class OpendataExport():
         dataset = self.setup['dataset']
         if self.setup.get('resources'):
             self._check_resources_fields()
-            dataset['resources'] = [self.setup['resources']]
-        response = requests.post(f'{self._api_url}datasets/', headers=self._auth, json=dataset)
-        self._handle_response('created', 'dataset', response, 201)
+            if self.snapshot is None:
+                dataset['resources'] = [self.setup['resources']]
+        response = self._session.post(f'{self._api_url}datasets/', headers=self._auth, json=dataset)
+        created = self._handle_response('created', 'dataset', response, 201)
+        if created:
+            DatasetResolver(self._api_url).record(response.json())
+        if created and self.setup.get('resources'):
+            if self.snapshot is not None:
+                # The exported files are uploaded once the dataset exists
+                return self._publish_snapshot(response.json())
+            self._record_fingerprint()
+        return created
 
     def _create_resource(self, url):
-        response = requests.post(url, headers=self._auth, json=self.setup['resources'])
+        response = self._session.post(url, headers=self._auth, json=self.setup['resources'])
         return response, 'created', 201
 
-    def _delete_resources(self, dataset_name, resources):
-        dataset = requests.get(f'{self._api_url}datasets/{dataset_name}')
+    def _delete_resources(self, dataset_name, selectors, previous=None):
+        dataset = self._session.get(f'{self._api_url}datasets/{dataset_name}')
         if dataset.status_code != 200:
-            print(f'/!\ The dataset {dataset_name} you want to delete has not been found. /!\ \nStatus: {dataset.status_code} - {dataset.text}')
-            return
+            self._display(f'/!\ The dataset {dataset_name} you want to delete has not been found. /!\ \nStatus: {dataset.status_code} - {dataset.text}')
+            return False
         dataset = dataset.json()
-        current_resources = tuple(resource['title'] for resource in dataset['resources'])
-        for resource in resources:
-            if resource not in current_resources:
-                print(f'The resource {resource} does not exist in the dataset {dataset_name}.')
-                break
-            for dataset_resource in dataset['resources']:
-                if resource == dataset_resource['title']:
-                    self._send_delete_request(f'{dataset["id"]}/resources/{dataset_resource["id"]}', resource, feature='resource')
-                    break
+        resources, not_found = self._match_resources(dataset['resources'], selectors)
+        already_deleted = []
+        if previous is not None:
+            # Only the selectors that could not be found by the previous attempt either are still missing
+            missing = set(previous.get('not_found', []))
+            already_deleted = [selector for selector in not_found if selector not in missing]
+            not_found = [selector for selector in not_found if selector in missing]
+        for selector in already_deleted:
+            self._display(f'The resource {selector} has already been deleted from the dataset {dataset_name}.')
+        for selector in not_found:
+            self._display(f'The resource {selector} does not exist in the dataset {dataset_name}.')
+        def delete_resource(resource):
+            return self._send_delete_request(f'{dataset["id"]}/resources/{resource["id"]}', resource['title'], feature='resource')
+        with ThreadPoolExecutor(max_workers=max(min(self.workers, len(resources)), 1)) as executor:
+            statuses = list(executor.map(delete_resource, resources))
+        deleted = [resource['id'] for resource, status in zip(resources, statuses) if status]
+        failed = [resource['id'] for resource, status in zip(resources, statuses) if not status]
+        self.result = {
+            'action': 'deleted', 'feature': 'resource', 'dataset': dataset['id'],
+            'deleted': deleted, 'failed': failed, 'not_found': not_found, 'already_deleted': already_deleted
+        }
+        if len(resources) + len(not_found) > 1:
+            self._display(f'{len(deleted)} resource(s) deleted from the dataset {dataset_name}, {len(failed)} failed, {len(not_found)} not found.')
+        return not failed and not not_found
 
     def _search_dataset(self, to_search):
-        dataset = requests.get(f'{self._api_url}datasets/{to_search}/')
+        dataset = self._session.get(f'{self._api_url}datasets/{to_search}/')
         if dataset.status_code == 200:
-            print(json.dumps(dataset.json(), indent=4))
-        else:
-            print(f'/!\ The dataset {to_search} you are looking for has not been found. /!\ \nStatus: {dataset.status_code} - {dataset.text}')
+            self.result = dataset.json()
+            self._display(json.dumps(self.result, indent=4))
+            return True
+        self._display(f'/!\ The dataset {to_search} you are looking for has not been found. /!\ \nStatus: {dataset.status_code} - {dataset.text}')
+        return False
 
     def _search_resources(self, dataset_to_search, resources_to_search):
-        dataset = requests.get(f'{self._api_url}datasets/{dataset_to_search}')
+        dataset = self._session.get(f'{self._api_url}datasets/{dataset_to_search}')
         if dataset.status_code != 200:
-            print(f'/!\ The dataset {dataset_to_search} you are looking for has not been found. /!\ \nStatus: {dataset.status_code} - {dataset.text}')
-            return
+            self._display(f'/!\ The dataset {dataset_to_search} you are looking for has not been found. /!\ \nStatus: {dataset.status_code} - {dataset.text}')
+            return False
         dataset = dataset.json()
+        self.result = dataset
         existing_resources = {resource['title']: resource for resource in dataset.pop('resources')}
         if len(existing_resources) == len(resources_to_search) and all(resource in existing_resources for resource in resources_to_search):
             dataset['resources'] = [resource for resource in existing_resources.values()]
-            print(json.dumps(dataset, indent=4))
-            return
+            self._display(json.dumps(dataset, indent=4))
+            return True
         resources = []
         not_found = []
         for resource in resources_to_search:
@@ -128,40 +293,174 @@ class OpendataExport():
         if not resources:
             dataset['resources'] = [resource for resource in existing_resources.values()]
             beginning, has = ('The resource', 'has not') if len(resources_to_search) == 1 else ('None of the resources', 'have')
-            print(f"{beginning} you looked for ({', '.join(resources_to_search)}) {has} been found in the following dataset:\n{json.dumps(dataset, indent=4)}")
-            return
+            self._display(f"{beginning} you looked for ({', '.join(resources_to_search)}) {has} been found in the following dataset:\n{json.dumps(dataset, indent=4)}")
+            return False
         if not_found:
             beginning, has = ('A resource', 'has') if len(not_found) == 1 else ('Some of the resources', 'have')
-            print(f"{beginning} you mentioned ({', '.join(not_found)}) {has} not been found in the dataset {dataset_to_search}.")
+            self._display(f"{beginning} you mentioned ({', '.join(not_found)}) {has} not been found in the dataset {dataset_to_search}.")
         dataset['resources'] = resources
-        print(f'Here is a subset of the available resources you looked for, within their dataset:\n{json.dumps(dataset, indent=4)}')
+        self._display(f'Here is a subset of the available resources you looked for, within their dataset:\n{json.dumps(dataset, indent=4)}')
+        return True
 
     def _update_dataset(self, dataset_id):
-        response = requests.put(f'{self._api_url}datasets/{dataset_id}/', headers=self._auth, json=self.setup['dataset'])
-        self._handle_response('updated', 'dataset', response, 200)
+        response = self._session.put(f'{self._api_url}datasets/{dataset_id}/', headers=self._auth, json=self.setup['dataset'])
+        return self._handle_response('updated', 'dataset', response, 200)
 
     def _update_resource(self, dataset, url):
         resource_id = self._get_resource_id(dataset['resources'], self.setup['resources']['title'])
-        response = requests.put(f'{url}{resource_id}/', headers=self._auth, json=self.setup['resources'])
+        response = self._session.put(f'{url}{resource_id}/', headers=self._auth, json=self.setup['resources'])
         return response, 'updated', 200
 
+    def _update_resource_content(self, current, url):
+        resource = self.setup['resources']
+        if self._metadata_changed(current, resource):
+            return None
+        if self._skip_unchanged(current, resource['title'], resource['checksum'], url=resource['url']):
+            # The fingerprint is recorded by _publish_resource
+            self.result = {'action': 'unchanged', 'feature': 'resource', 'id': current['id']}
+            return True
+        payload = {field: resource[field] for field in _RESOURCE_REQUIRED_FIELDS}
+        payload.update({field: resource[field] for field in ('checksum', 'filesize') if field in resource})
+        payload['last_modified'] = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
+        response = self._session.put(f"{url}{current['id']}/", headers=self._auth, json=payload)
+        return self._handle_response('updated', 'resource', response, 200)
+
+    def _publish_snapshot(self, dataset):
+        resource = self.setup['resources']
+        filename = re.sub(r'[^a-z0-9._-]+', '-', resource['title'].lower()).strip('-')
+        parts = write_snapshot(
+            resource['url'], pathlib.Path(self.snapshot['directory']) / dataset['id'] / f"{filename}.{resource['format']}",
+            compression=self.snapshot['compression'], part_size=self.snapshot['part_size'],
+            headers=misp_headers(self.misp_auth), checksum_type=self.checksum_type or 'sha256',
+            display=self._display
+        )
+        if parts is None:
+            return False
+        titles = [resource['title']]
+        if len(parts) > 1:
+            titles = [f"{resource['title']} (part {index}/{len(parts)})" for index in range(1, len(parts) + 1)]
+        existing = {current['title']: current for current in dataset['resources']}
+        upload_headers = {key: value for key, value in self._auth.items() if key != 'Content-type'}
+        published = True
+        for title, part in zip(titles, parts):
+            current = existing.pop(title, None)
+            if self.incremental and current is not None and self._skip_unchanged(current, title, part['checksum']):
+                continue
+            url = f"{self._api_url}datasets/{dataset['id']}/"
+            if current is not None:
+                url = f"{url}resources/{current['id']}/"
+            with open(part['path'], 'rb') as f:
+                upload = self._session.post(
+                    f'{url}upload/', headers=upload_headers,
+                    files={'file': (part['path'].name, f, mime_type(self.snapshot['compression']))}
+                )
+            if upload.status_code not in (200, 201):
+                self._display_error(upload)
+                published = False
+                continue
+            metadata = {field: value for field, value in resource.items() if field not in ('filetype', 'format', 'url')}
+            metadata.update(
+                title=title, checksum=part['checksum'], filesize=part['filesize'],
+                mime_type=mime_type(self.snapshot['compression'])
+            )
+            response = self._session.put(
+                f"{self._api_url}datasets/{dataset['id']}/resources/{upload.json()['id']}/", headers=self._auth, json=metadata
+            )
+            published &= self._handle_response('created' if current is None else 'updated', 'resource', response, 200)
+        for title, current in existing.items():
+            # Parts of a previous snapshot of this resource that are not needed anymore
+            if title == resource['title'] or title.startswith(f"{resource['title']} (part "):
+                published &= self._send_delete_request(f"{dataset['id']}/resources/{current['id']}", title, feature='resource')
+        return published
+
     def _update_resources(self, dataset):
         self._check_resources_fields()
-        url = f'{self._api_url}datasets/{dataset["id"]}/resources/'
-        match = any(self.setup['resources']['title'] == resource['title'] for resource in dataset['resources'])
-        response, action, status = self._update_resource(dataset, url) if match else self._create_resource(url)
-        self._handle_response(action, 'resource', response, status)
+        if self.snapshot is not None:
+            return self._publish_snapshot(dataset)
+        return self._publish_resource(dataset)
+
+    def _update_resources_bulk(self, dataset, setups):
+        resources = [dict(resource) for resource in dataset['resources']]
+        positions = {resource['title']: position for position, resource in enumerate(resources)}
+        to_publish = []
+        for setup in setups:
+            resource = setup['resources']
+            position = positions.get(resource['title'])
+            if position is None:
+                positions[resource['title']] = len(resources)
+                resources.append(dict(resource))
+                to_publish.append(True)
+                continue
+            current = resources[position]
+            same_metadata = self.incremental and 'checksum' in resource and not self._metadata_changed(current, resource)
+            if same_metadata and self._skip_unchanged(current, resource['title'], resource['checksum'], url=resource['url']):
+                self._record_fingerprint(resource)
+                to_publish.append(False)
+                continue
+            current.update(resource)
+            current['last_modified'] = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
+            to_publish.append(True)
+        if not any(to_publish):
+            self.result = {'action': 'unchanged', 'feature': 'dataset', 'id': dataset['id']}
+            return [True] * len(setups)
+        payload = {field: dataset[field] for field in ('title', 'description', 'frequency') if field in dataset}
+        payload['resources'] = resources
+        response = self._session.put(f"{self._api_url}datasets/{dataset['id']}/", headers=self._auth, json=payload)
+        if response.status_code in _BULK_REJECTED_STATUSES:
+            self._display(f'The portal rejected the resources embedded in the dataset {dataset["title"]}, they are submitted one by one.')
+            statuses = [self._publish_resource(dataset, setup) if publish else True for setup, publish in zip(setups, to_publish)]
+            if response.status_code in _BULK_UNSUPPORTED_STATUSES or all(statuses):
+                # The bulk payload is what the portal does not accept: the next groups of resources are directly submitted one by one
+                self._adapter.update(bulk=False)
+            return statuses
+        if not self._handle_response('updated', 'dataset', response, 200):
+            return [False] * len(setups)
+        published = {resource['title'] for resource in response.json().get('resources', [])}
+        statuses = []
+        for setup, publish in zip(setups, to_publish):
+            if publish and setup['resources']['title'] not in published:
+                # The portal ignored the embedded resources
+                statuses.append(self._publish_resource(dataset, setup))
+                continue
+            if publish:
+                self._record_fingerprint(setup['resources'])
+            statuses.append(True)
+        return statuses
 
     ################################################################################
     #                              UTILITY FUNCTIONS                               #
     ################################################################################
 
-    def _send_delete_request(self, to_delete, to_display, feature='dataset'):
-        delete = requests.delete(f'{self._api_url}datasets/{to_delete}', headers=self._auth)
-        if delete.status_code == 204:
-            print(f'The {feature} {to_display} has been deleted from the open data portal.')
-        else:
-            print(f'/!\ The {feature} {to_display} has not been deleted. /!\ \nStatus code: {delete.status_code} - {delete.text}')
+    def _publish_resource(self, dataset, setup=None):
+        if setup is not None:
+            self.setup = setup
+        url = f'{self._api_url}datasets/{dataset["id"]}/resources/'
+        title = self.setup['resources']['title']
+        current = next((resource for resource in dataset['resources'] if resource['title'] == title), None)
+        if current is not None and self.incremental and 'checksum' in self.setup['resources']:
+            # Only the content related fields are sent when nothing but the restSearch results changed
+            published = self._update_resource_content(current, url)
+            if published is not None:
+                if published:
+                    self._record_fingerprint()
+                return published
+        response, action, status = self._update_resource(dataset, url) if current is not None else self._create_resource(url)
+        published = self._handle_response(action, 'resource', response, status)
+        if published:
+            self._record_fingerprint()
+        return published
+
+    def _send_delete_request(self, to_delete, to_display, feature='dataset', replay=False):
+        delete = self._session.delete(f'{self._api_url}datasets/{to_delete}', headers=self._auth)
+        if delete.status_code == 204 or (replay and delete.status_code == 404):
+            if feature == 'dataset':
+                DatasetResolver(self._api_url).forget(to_delete)
+            self.result = {'action': 'deleted', 'feature': feature, 'name': to_display}
+            deleted = 'has already been deleted' if delete.status_code == 404 else 'has been deleted'
+            self._display(f'The {feature} {to_display} {deleted} from the open data portal.')
+            return True
+        self._display(f'/!\ The {feature} {to_display} has not been deleted. /!\ \nStatus code: {delete.status_code} - {delete.text}')
+        return False
 
     def _check_dataset_fields(self):
         if 'frequency' not in self.setup['dataset']:
@@ -172,12 +471,17 @@ class OpendataExport():
         self.setup['dataset']['page'] = f'{self._dataset_url}{slug}/'
         self.setup['dataset']['uri'] = f'{self._api_url}datasets/{slug}/'
 
-    def _check_resources_fields(self):
+    def _check_resources_fields(self, checksum=True):
         for feature, value in zip(('filetype', 'format'), ('remote', 'json')):
             if feature not in self.setup['resources']:
                 self.setup['resources'][feature] = value
-        misp_url = self.misp_url if self.misp_url.endswith('/') else f'{self.misp_url}/'
-        self.setup['resources']['url'] = f"{misp_url}{self.level}/restSearch/{'/'.join(self._fill_url(key, value) for key, value in self.body.items())}"
+        self.setup['resources']['url'] = restsearch_url(self.misp_url, self.level, self.body)
+        if checksum and self.checksum_type is not None and self.snapshot is None:
+            fields = stream_checksum(
+                self.setup['resources']['url'], self.checksum_type, headers=misp_headers(self.misp_auth), display=self._display
+            )
+            if fields is not None:
+                self.setup['resources'].update(fields)
 
     def _create_dataset_url(self, action, response):
         dataset_id = response.json()['id']
@@ -186,22 +490,26 @@ class OpendataExport():
 
 
     def _create_resource_url(self, action, response):
-        if action == 'updated':
+        # The url of a PUT is the one of the resource, also when the metadata of an uploaded file are set after its creation
+        if action == 'updated' or response.request.method == 'PUT':
             dataset_id, _, resource_id = response.url.split('/')[-4:-1]
             return f'{self._dataset_url}{dataset_id}/#resource-{resource_id}', response.url
         dataset_id = response.url.split('/')[-3]
         resource_id = response.json()["id"]
         return f'{self._dataset_url}{dataset_id}/#resource-{resource_id}', f'{response.url}{resource_id}'
 
+    def _display(self, message):
+        print(message)
+
     def _display_confirmation(self, action, feature, response):
         message = f'Your {feature} has been successfully {action}.\n'
         url, api_url = self._create_dataset_url(action, response) if feature == 'dataset' else self._create_resource_url(action, response)
+        self.result = {'action': action, 'feature': feature, 'id': response.json()['id'], 'page': url, 'uri': api_url}
         message = f'{message}It is available under the following link: {url}\n'
-        print(f'{message}You can also find the json format equivalent: {api_url}')
+        self._display(f'{message}You can also find the json format equivalent: {api_url}')
 
-    @staticmethod
-    def _display_error(response):
-        print(f'/!\ Your query encountered an error. /!\ \n{response.status_code} - {response.reason} - {response.text}')
+    def _display_error(self, response):
+        self._display(f'/!\ Your query encountered an error. /!\ \n{response.status_code} - {response.reason} - {response.text}')
 
     @staticmethod
     def _fill_url(key, value):
@@ -209,6 +517,74 @@ class OpendataExport():
             return '/'.join(f'{key}[]:{val}' for val in value)
         return f'{key}:{value}'
 
+    def _find_dataset(self):
+        # The title is looked up with the query parameters of the portal, instead of being used as a slug,
+        # among the datasets of the owner only: the ones of the other publishers cannot be updated anyway
+        return DatasetResolver(self._api_url, headers=self._auth, display=self._display).resolve(self.setup['dataset']['title'], owner=self.owner)
+
+    def _get_owner(self):
+        # The account behind the API key: only its datasets and the ones of its organizations can be updated
+        if self.owner is None:
+            key = (self._api_url, self._auth.get('X-API-KEY'))
+            if key not in _OWNERS:
+                me = self._session.get(f'{self._api_url}me', headers=self._auth)
+                if me.status_code != 200:
+                    self._display('/!\\ Unable to fetch the information of your account. /!\\')
+                    self._display_error(me)
+                    return None
+                # Fetched once per run, for every export using the same key
+                _OWNERS[key] = me.json()
+            self.owner = _OWNERS[key]
+        return self.owner
+
+    @staticmethod
+    def _metadata_changed(current, resource):
+        return any(current.get(field) != value for field, value in resource.items() if field not in _CONTENT_FIELDS)
+
+    def _record_fingerprint(self, resource=None):
+        if resource is None:
+            resource = self.setup['resources']
+        if self.incremental and 'checksum' in resource:
+            get_store().set(self._api_url, resource['url'], resource['checksum'], filesize=resource.get('filesize'))
+
+    def _skip_unchanged(self, current, title, checksum, url=None):
+        # Same content as the current resource, or as the last publication of the restSearch query behind `url`
+        fingerprint = get_store().get(self._api_url, url) if url is not None else None
+        if checksum not in (fingerprint, current.get('checksum')):
+            return False
+        self._display(f'The content of the resource {title} has not changed since its last publication, it has not been submitted again.')
+        return True
+
+    def _match_resources(self, resources, selectors):
+        # Selectors are resource ids, titles, glob patterns on the titles, or regular expressions prefixed with `re:`
+        by_id = {resource['id']: resource for resource in resources}
+        by_title = defaultdict(list)
+        for resource in resources:
+            by_title[resource['title']].append(resource)
+        matched = {}
+        not_found = []
+        for selector in selectors:
+            if selector in by_id:
+                matches = [by_id[selector]]
+            elif selector in by_title:
+                matches = by_title[selector]
+            elif selector.startswith('re:'):
+                try:
+                    pattern = re.compile(selector[3:])
+                except re.error as error:
+                    self._display(f'/!\\ The regular expression {selector[3:]} is invalid. /!\\ \n{error}')
+                    matches = []
+                else:
+                    matches = [resource for resource in resources if pattern.search(resource['title'])]
+            elif any(character in selector for character in '*?['):
+                matches = [resource for resource in resources if fnmatch.fnmatchcase(resource['title'], selector)]
+            else:
+                matches = []
+            if not matches:
+                not_found.append(selector)
+            matched.update((resource['id'], resource) for resource in matches)
+        return list(matched.values()), not_found
+
     @staticmethod
     def _get_resource_id(resources, title):
         for resource in resources:
@@ -218,40 +594,230 @@ class OpendataExport():
     def _handle_response(self, action, feature, response, status_code):
         if response.status_code == status_code:
             self._display_confirmation(action, feature, response)
-        else:
-            self._display_error(response)
+            return True
+        self._display_error(response)
+        return False
 
 
 def _check_portal_arguments(auth_arg, url_arg):
-    portal_url = None
-    with open(f'{_ABSOLUTE_PATH}/supported_portals.json', 'rt', encoding='utf-8') as f:
-        supported_portals = json.loads(f.read())
-    for supported_portal in supported_portals:
-        if url_arg in supported_portal:
-            portal_url = supported_portal
-            break
+    supported_portals = load_supported_portals()
+    portal_url = find_portal(url_arg, supported_portals)
     if not portal_url:
         portal_urls = '\n - '.join(supported_portals)
         print(f'/!\ The provided portal url is not supported yet (or misspelled). /!\ \nPlease choose one of the followings:\n - {portal_urls}')
         sys.exit(0)
     if auth_arg is None:
-        with open(f'{_ABSOLUTE_PATH}/auth.json', 'rt', encoding='utf-8') as f:
-            authentication = json.loads(f.read())
-        return authentication, portal_url
+        return portal_credentials(load_authentication(), portal_url), portal_url
     return {"X-API-KEY": auth_arg}, portal_url
 
 
+def _checksum_settings(defaults):
+    return {
+        'checksum_type': defaults['checksum_type'], 'misp_auth': defaults['misp_auth'],
+        'incremental': defaults['incremental']
+    }
+
+
+def group_manifest(entries):
+    groups = defaultdict(list)
+    for index, entry in enumerate(entries):
+        try:
+            # Deletions name the dataset by its slug (or id), submissions by its title, from which the slug is derived
+            dataset = '-'.join(_manifest_item(entry)[1].lower().strip().split(' '))
+        except (AttributeError, KeyError, TypeError):
+            dataset = None
+        groups[dataset].append((index, entry))
+    return groups
+
+
+def load_defaults(args):
+    body = args.body if args.body is not None else f'{_ABSOLUTE_PATH}/body.json'
+    with open(body, 'rt', encoding='utf-8') as f:
+        return {
+            'body': json.loads(f.read()), 'level': args.level, 'misp_url': args.misp_url,
+            'checksum_type': args.checksum, 'incremental': args.incremental, 'misp_auth': args.misp_auth,
+            'bulk': args.bulk, 'snapshot': snapshot_settings(args)
+        }
+
+
+def load_authentication():
+    with open(f'{_ABSOLUTE_PATH}/auth.json', 'rt', encoding='utf-8') as f:
+        return json.loads(f.read())
+
+
+def load_manifest(filename, args):
+    with open(filename, 'rt', encoding='utf-8') as f:
+        content = f.read()
+    try:
+        entries = json.loads(content)
+    except json.JSONDecodeError:
+        entries = [json.loads(line) for line in content.splitlines() if line.strip()]
+    return entries if isinstance(entries, list) else [entries], load_defaults(args)
+
+
+def _manifest_item(entry):
+    if entry.get('delete'):
+        return 'delete', entry['delete'][0], ', '.join(entry['delete'][1:])
+    resource = entry['setup'].get('resources', {}).get('title', '')
+    return 'submit', entry['setup']['dataset']['title'], resource
+
+
+def portal_credentials(authentication, portal_url):
+    # auth.json may also contain one set of credentials per portal, keyed by portal url
+    for portal, credentials in authentication.items():
+        if isinstance(credentials, dict) and portal in portal_url:
+            return dict(credentials)
+    return dict(authentication)
+
+
+def process_manifest_group(auth, portal_url, defaults, group, journal=None):
+    results = []
+    pending = []
+    bulk = defaults['bulk'] and not defaults['snapshot'] and get_adapter(portal_url).capabilities['bulk']
+    for index, entry in group:
+        try:
+            action, dataset, resource = _manifest_item(entry)
+        except (AttributeError, KeyError, TypeError):
+            results.append((index, 'invalid', f'entry #{index}', False))
+            continue
+        name = f'{dataset} / {resource}' if resource else dataset
+        key = None
+        previous = None
+        if journal is not None:
+            key = journal.key(portal_url, index, entry)
+            if journal.is_completed(key):
+                results.append((index, action, name, True))
+                continue
+            previous = journal.previous_result(key)
+            journal.begin(key, index, action, name, portal_url, dataset)
+        if bulk and action == 'submit' and resource:
+            # Consecutive resources of the dataset are published with a single dataset write
+            pending.append((index, name, entry, key))
+            continue
+        results.extend(_submit_pending(auth, portal_url, defaults, pending, journal))
+        pending = []
+        opendata_export = OpendataExport(dict(auth), portal_url)
+        try:
+            if action == 'delete':
+                status = opendata_export.delete_data(entry['delete'], previous=previous)
+            else:
+                opendata_export.load_query(**_query(entry, defaults), **_checksum_settings(defaults))
+                status = opendata_export.submit_data()
+        except requests.RequestException as error:
+            print(f'/!\ Your query encountered an error. /!\ \n{error}')
+            status = False
+        except (AttributeError, IndexError, KeyError, TypeError, ValueError) as error:
+            # Only this entry fails, the next ones of the batch are still processed
+            print(f'/!\\ Invalid entry #{index}, missing or malformed field: {error} /!\\')
+            status = False
+        if journal is not None:
+            journal.complete(key, status, opendata_export.result)
+        results.append((index, action, name, bool(status)))
+    results.extend(_submit_pending(auth, portal_url, defaults, pending, journal))
+    return results
+
+
+def _query(entry, defaults):
+    return {
+        'setup': entry['setup'], 'body': entry.get('body', defaults['body']),
+        'level': entry.get('level', defaults['level']), 'misp_url': entry.get('misp_url', defaults['misp_url']),
+        'snapshot': defaults['snapshot']
+    }
+
+
+def restsearch_url(misp_url, level, body):
+    misp_url = misp_url if misp_url.endswith('/') else f'{misp_url}/'
+    return f"{misp_url}{level}/restSearch/{'/'.join(OpendataExport._fill_url(key, value) for key, value in body.items())}"
+
+
+def run_manifest(auth, portal_url, args):
+    try:
+        entries, defaults = load_manifest(args.manifest, args)
+    except (FileNotFoundError, PermissionError, json.JSONDecodeError) as error:
+        print(f'/!\ The manifest file specified ({args.manifest}) cannot be loaded. /!\ \n{error}')
+        return 1
+    results = []
+    with open_journal(args.journal, resume=args.resume) as journal:
+        if args.resume:
+            completed = sum(1 for index, entry in enumerate(entries) if journal.is_completed(journal.key(portal_url, index, entry)))
+            print(f'{completed} operation(s) already completed during the previous run are skipped.')
+        with ThreadPoolExecutor(max_workers=max(args.workers, 1)) as executor:
+            futures = [
+                executor.submit(process_manifest_group, auth, portal_url, defaults, group, journal)
+                for group in group_manifest(entries).values()
+            ]
+            for future in as_completed(futures):
+                results.extend(future.result())
+    return 1 if display_summary(results) else 0
+
+
+def _submit_pending(auth, portal_url, defaults, pending, journal=None):
+    if not pending:
+        return []
+    opendata_export = OpendataExport(dict(auth), portal_url)
+    try:
+        if len(pending) == 1:
+            opendata_export.load_query(**_query(pending[0][2], defaults), **_checksum_settings(defaults))
+            statuses = [opendata_export.submit_data()]
+        else:
+            queries = [_query(entry, defaults) for _, _, entry, _ in pending]
+            statuses = opendata_export.submit_bulk(queries, **_checksum_settings(defaults))
+    except requests.RequestException as error:
+        print(f'/!\ Your query encountered an error. /!\ \n{error}')
+        statuses = [False] * len(pending)
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError) as error:
+        print(f"/!\\ Invalid entry among #{', #'.join(str(index) for index, _, _, _ in pending)}, missing or malformed field: {error} /!\\")
+        statuses = [False] * len(pending)
+    if journal is not None:
+        for (_, _, _, key), status in zip(pending, statuses):
+            journal.complete(key, status, opendata_export.result)
+    return [(index, 'submit', name, bool(status)) for (index, name, _, _), status in zip(pending, statuses)]
+
+
+def display_summary(results, title='Batch summary'):
+    print(f'\n{title}:')
+    for index, action, name, status in sorted(results):
+        print(f" - [{'OK' if status else 'FAILED'}] #{index} {action}: {name}")
+    failed = sum(1 for result in results if not result[-1])
+    print(f'{len(results) - failed} succeeded, {failed} failed.')
+    return failed
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Export a restSearch collection of data as feed.')
     parser.add_argument('--level', default='events', help='Level to query, in order to define the relative path.')
     parser.add_argument('--body', help='Body of the query. (using body.json file if not set)')
     parser.add_argument('--setup', help='Setup of the query containing the dataset (and resource) name(s). (using setup.json file if not set)')
     parser.add_argument('--misp_url', default='https://misppriv.circl.lu', help='Url of the MISP instance.')
+    parser.add_argument('--misp_auth', help='MISP API key used to download the restSearch results when computing their checksum.')
+    parser.add_argument('--checksum', choices=CHECKSUM_TYPES, help='Download the restSearch results to set the checksum (with the given hash algorithm), file size and mime type of the resources.')
+    parser.add_argument('--incremental', action='store_true', help='Skip the resources whose restSearch results did not change since their last publication, and only update the checksum, file size and last modification date of the ones whose results changed.')
     parser.add_argument('--portal_url', default='data.public.lu', help='Url of the Open data portal.')
     parser.add_argument('--auth', help='Authentication required for the opendata portal (API key). (using auth.json file if not set)')
-    parser.add_argument('-d', '--delete', nargs='+', help='Delete a specific dataset or some ressources of a dataset')
+    parser.add_argument('-d', '--delete', nargs='+', help='Delete a specific dataset or some ressources of a dataset (identified by their id, title, a glob pattern on their title, or a regular expression prefixed with re:)')
     parser.add_argument('-s', '--search', nargs='+', help='Search for a dataset or resources.')
+    parser.add_argument('--stream', action='store_true', help='With the search parameter, display the resources as soon as they are received, one compact JSON document per line.')
+    parser.add_argument('--fields', help='Comma separated list of the resource fields displayed with --stream (e.g. id,title,url,last_modified).')
     parser.add_argument('--query_data', help='Query parameters passed as a JSON file (accepted keys: level, setup, misp_url, portal_url, auth.')
+    parser.add_argument('--portals', nargs='+', help='Publish to several Open data portals at once (instead of --portal_url).')
+    parser.add_argument('--portal_concurrency', type=int, default=4, help='Maximum number of datasets processed concurrently on each portal with --portals.')
+    parser.add_argument('--manifest', help='JSON list or JSONL file of entries (setup, body, level, misp_url, or delete) to process in batch.')
+    parser.add_argument('--bulk', action='store_true', help='Publish the resources of a same dataset listed in a manifest (or registry) with a single dataset-level query.')
+    parser.add_argument('--snapshot', choices=COMPRESSIONS, help='Download the restSearch results once and publish them as compressed files uploaded to the portal, instead of resources pointing to MISP.')
+    parser.add_argument('--snapshot_part_size', type=float, help='With --snapshot, split the compressed results in files of about this size (in MiB), to concatenate before decompressing them.')
+    parser.add_argument('--snapshot_directory', help='Directory where the snapshots are written before being uploaded. (using .cache/snapshots if not set)')
+    add_arguments(parser)
+    metrics.add_arguments(parser)
+    portals.add_arguments(parser)
+    parser.add_argument('--sync', help='Desired state file (same format as the manifest) to reconcile with the portal, sending only the changes.')
+    parser.add_argument('--plan', action='store_true', help='With --sync, only display the changes that would be applied.')
+    parser.add_argument('--daemon', help='Registry file (same format as the manifest) of the datasets to refresh continuously according to their update frequency.')
+    parser.add_argument('--schedule_state', default=f'{_ABSOLUTE_PATH}/.cache/schedule.json', help='File where the daemon persists its schedule.')
+    parser.add_argument('--schedule_jitter', type=float, default=0.1, help='Random delay added to each refresh of the daemon, as a fraction of the dataset update interval.')
+    parser.add_argument('--default_interval', type=float, help='Refresh interval (in seconds) used by the daemon for datasets without regular update frequency (not refreshed if not set).')
+    parser.add_argument('--journal', default=f'{_ABSOLUTE_PATH}/.cache/journal.jsonl', help='File where the operations of a manifest (or --portals) run and their outcome are recorded.')
+    parser.add_argument('--resume', action='store_true', help='Resume the interrupted manifest (or --portals) run recorded in the journal, skipping the operations already completed.')
+    parser.add_argument('--workers', type=int, default=8, help='Number of datasets processed concurrently in manifest mode, or of resources deleted concurrently.')
     args = parser.parse_args()
     if args.query_data:
         filename = args.query_data
@@ -264,14 +830,38 @@ if __name__ == '__main__':
         except (FileNotFoundError, PermissionError):
             print(f'/!\ The command file specified ({filename}) cannot be opened. /!\ ')
             sys.exit(0)
-    auth, portal_url = _check_portal_arguments(args.auth, args.portal_url)
+    metrics.setup(args)
+    configure_from_arguments(args)
+    portals.setup(args)
+    if args.portals:
+        from publisher import run_fanout
+        targets = [_check_portal_arguments(args.auth, portal) for portal in args.portals]
+        sys.exit(run_fanout(targets, args))
+    with metrics.phase('check_portal_arguments'):
+        auth, portal_url = _check_portal_arguments(args.auth, args.portal_url)
+    if args.daemon:
+        from scheduler import run_daemon
+        sys.exit(run_daemon(auth, portal_url, args))
+    if args.sync:
+        from sync import run_sync
+        sys.exit(run_sync(auth, portal_url, args))
+    if args.manifest:
+        sys.exit(run_manifest(auth, portal_url, args))
     opendata_export = OpendataExport(auth, portal_url)
     if args.search:
         if args.delete:
             print('The search parameter is used alongside with the delete parameter. For now we will only show the result of the search query, if you want to delete some data, please remove the search parameter.')
-        opendata_export.search_data(args.search)
+        with metrics.phase('search_data'):
+            if args.stream:
+                opendata_export.stream_search(args.search, fields=parse_fields(args.fields))
+            else:
+                opendata_export.search_data(args.search)
     elif args.delete:
-        opendata_export.delete_data(args.delete)
+        opendata_export.workers = args.workers
+        with metrics.phase('delete_data'):
+            opendata_export.delete_data(args.delete)
     else:
-        opendata_export.parse_arguments(args)
-        opendata_export.submit_data()
+        with metrics.phase('parse_arguments'):
+            opendata_export.parse_arguments(args)
+        with metrics.phase('submit_data'):
+            opendata_export.submit_data()
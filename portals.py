@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import os
+import pathlib
+import re
+import requests
+import threading
+import time
+import transport
+import uuid
+from transport import configure_from_arguments, configure_portal, get_session
+from urllib.parse import urlsplit
+
+_ABSOLUTE_PATH = pathlib.Path(__file__).parent.absolute()
+_CAPABILITIES_PATH = _ABSOLUTE_PATH / '.cache' / 'portals.json'
+_LOCK = threading.Lock()
+_PORTALS = {}
+_PROBE_PAGE_SIZE = 1000
+_RATE_LIMIT_POLICY = re.compile(r'\s*(?P<quota>\d+)\s*;\s*w=(?P<window>\d+)')
+_SETTINGS = {
+    'path': _CAPABILITIES_PATH,
+    'ttl': 86400.0
+}
+_SUPPORTED_PORTALS_PATH = _ABSOLUTE_PATH / 'supported_portals.json'
+
+
+class PortalAdapter():
+    """Paths & capabilities of an Open data portal.
+
+    The capabilities are detected once, then read from the cache file until they are
+    older than the configured TTL. Those forced in supported_portals.json take precedence.
+    """
+    api_path = None
+    dataset_path = None
+    default_capabilities = {}
+
+    def __init__(self, url, api_path=None, dataset_path=None, capabilities=None):
+        self.url = url
+        self.api_url = f'{url}{api_path or self.api_path}'
+        self.dataset_url = f'{url}{dataset_path or self.dataset_path}'
+        self._forced = capabilities or {}
+        self._capabilities = None
+        self._lock = threading.Lock()
+
+    @property
+    def capabilities(self):
+        return self.load()
+
+    def detect(self):
+        # Nothing more than the default capabilities is known about a generic portal
+        return {}
+
+    def load(self, refresh=False, display=print):
+        with self._lock:
+            if self._capabilities is None or refresh:
+                capabilities = None if refresh else _read_capabilities(self.url)
+                if capabilities is None:
+                    capabilities = dict(self.default_capabilities)
+                    try:
+                        capabilities.update(self.detect())
+                        _write_capabilities(self.url, capabilities)
+                    except requests.RequestException as error:
+                        # Detected again by the next run
+                        display(f'/!\\ Unable to detect the capabilities of {self.url}. /!\\ \n{error}')
+                capabilities.update(self._forced)
+                self._capabilities = capabilities
+                configure_portal(self.url, rate_limit=capabilities.get('rate_limit'), rate_burst=capabilities.get('rate_burst'))
+            return self._capabilities
+
+    def page_size(self, requested):
+        maximum = self.capabilities.get('max_page_size')
+        return min(requested, maximum) if maximum else requested
+
+    def update(self, **capabilities):
+        """Record a capability learned from the answer of the portal to an actual query."""
+        current = self.capabilities
+        with self._lock:
+            current.update(capabilities)
+            current.update(self._forced)
+            _write_capabilities(self.url, {key: value for key, value in current.items() if key not in self._forced})
+
+
+class UdataAdapter(PortalAdapter):
+    """Portals running udata (data.public.lu, data.gouv.fr)."""
+    api_path = 'api/1/'
+    dataset_path = 'en/datasets/'
+    default_capabilities = {
+        'api_versions': ['1'],
+        'bulk': True,
+        'max_page_size': None,
+        'rate_burst': None,
+        'rate_limit': None,
+        'search': True
+    }
+
+    def detect(self):
+        session = get_session(self.api_url)
+        capabilities = {}
+        # A search with no possible result tells whether `q` filters the datasets, and the page size actually used
+        probe = session.get(f'{self.api_url}datasets/', params={'q': uuid.uuid4().hex, 'page_size': _PROBE_PAGE_SIZE})
+        if probe.status_code == 200:
+            page = probe.json()
+            capabilities['search'] = page.get('total') == 0
+            if page.get('page_size', _PROBE_PAGE_SIZE) < _PROBE_PAGE_SIZE:
+                capabilities['max_page_size'] = page['page_size']
+            capabilities.update(_rate_limits(probe.headers))
+        version_2 = session.get(f'{self.url}api/2/datasets/search/', params={'page_size': 1})
+        if version_2.status_code == 200:
+            capabilities['api_versions'] = ['1', '2']
+        return capabilities
+
+
+_ADAPTERS = {
+    'udata': UdataAdapter
+}
+
+
+def add_arguments(parser):
+    parser.add_argument('--capabilities_ttl', type=float, default=_SETTINGS['ttl'], help='Number of seconds the capabilities detected for each portal are kept in .cache/portals.json.')
+
+
+def configure(path=None, ttl=None):
+    with _LOCK:
+        if path is not None:
+            _SETTINGS['path'] = pathlib.Path(path)
+        if ttl is not None:
+            _SETTINGS['ttl'] = ttl
+
+
+def find_portal(url_arg, supported_portals):
+    """First supported portal url containing `url_arg` (e.g. `data.gouv.fr` for https://www.data.gouv.fr/), or None."""
+    for supported_portal in supported_portals:
+        if url_arg in supported_portal:
+            return supported_portal
+
+
+def get_adapter(url):
+    """Adapter of the portal serving `url` (any url of the portal, including its API urls)."""
+    parsed = urlsplit(url if '://' in url else f'https://{url}')
+    portal_url = f'{parsed.scheme}://{parsed.netloc}/'
+    with _LOCK:
+        if portal_url not in _PORTALS:
+            try:
+                settings = dict(load_portals().get(portal_url, {}))
+            except (FileNotFoundError, json.JSONDecodeError):
+                settings = {}
+            adapter = _ADAPTERS[settings.pop('adapter', 'udata')]
+            _PORTALS[portal_url] = adapter(portal_url, **settings)
+        return _PORTALS[portal_url]
+
+
+def load_portals():
+    """Settings of the supported portals, by url: a portal is listed by its url, or as an object with
+    its `url` and optionally its `adapter`, `api_path`, `dataset_path` and forced `capabilities`."""
+    with open(_SUPPORTED_PORTALS_PATH, 'rt', encoding='utf-8') as f:
+        entries = json.loads(f.read())
+    portals = {}
+    for entry in entries:
+        settings = dict(entry) if isinstance(entry, dict) else {'url': entry}
+        portals[settings.pop('url')] = settings
+    return portals
+
+
+def load_supported_portals():
+    return list(load_portals())
+
+
+def _rate_limits(headers):
+    # RateLimit-Policy: <quota>;w=<window in seconds>
+    policy = _RATE_LIMIT_POLICY.match(headers.get('RateLimit-Policy') or headers.get('X-RateLimit-Policy') or '')
+    if policy is None:
+        return {}
+    quota, window = int(policy.group('quota')), int(policy.group('window'))
+    return {'rate_limit': quota / window if window else None, 'rate_burst': quota}
+
+
+def _read_capabilities(url):
+    with _LOCK:
+        try:
+            with open(_SETTINGS['path'], 'rt', encoding='utf-8') as f:
+                entry = json.loads(f.read()).get(url)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+    if entry is None or time.time() - entry['detected_at'] > _SETTINGS['ttl']:
+        return None
+    return entry['capabilities']
+
+
+def setup(args):
+    configure(ttl=args.capabilities_ttl)
+
+
+def _write_capabilities(url, capabilities):
+    path = pathlib.Path(_SETTINGS['path'])
+    with _LOCK:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(path, 'rt', encoding='utf-8') as f:
+                content = json.loads(f.read())
+        except (FileNotFoundError, json.JSONDecodeError):
+            content = {}
+        content[url] = {'detected_at': time.time(), 'capabilities': capabilities}
+        temporary = path.with_suffix('.tmp')
+        with open(temporary, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps(content, indent=4))
+        os.replace(temporary, path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Detect (or display the cached) capabilities of the supported Open data portals.')
+    parser.add_argument('--portal_url', nargs='+', help='Url of the portals to check. (all the supported portals if not set)')
+    parser.add_argument('--refresh', action='store_true', help='Detect the capabilities again, even if they are still cached.')
+    add_arguments(parser)
+    transport.add_arguments(parser)
+    args = parser.parse_args()
+    configure_from_arguments(args)
+    setup(args)
+    for portal_url in args.portal_url or load_portals():
+        adapter = get_adapter(portal_url)
+        capabilities = adapter.load(refresh=args.refresh)
+        print(f'{adapter.url} ({type(adapter).__name__}, API: {adapter.api_url})\n{json.dumps(capabilities, indent=4)}')
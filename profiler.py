@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import pathlib
+import requests
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from checksum import misp_headers
+from mock_misp import MockMISP
+from opendata import restsearch_url
+from transport import add_arguments, configure_from_arguments, get_session
+
+_ABSOLUTE_PATH = pathlib.Path(__file__).parent.absolute()
+_CHUNK_SIZE = 1024 * 1024
+_SORT_KEYS = (
+    'size',
+    'throughput',
+    'total',
+    'ttfb'
+)
+
+
+def build_queries(setups, bodies, levels, misp_url):
+    """Combine each setup with each body & level, unless a manifest entry sets them itself.
+
+    Queries sharing the same restSearch url are only profiled once.
+    """
+    queries = {}
+    for setup_file in setups:
+        for entry in _load_entries(setup_file):
+            setup = entry['setup']
+            label = setup.get('resources', {}).get('title') or setup.get('dataset', {}).get('title', setup_file)
+            entry_bodies = [(None, entry['body'])] if 'body' in entry else bodies
+            for body_file, body in entry_bodies:
+                for level in [entry['level']] if 'level' in entry else levels:
+                    url = restsearch_url(entry.get('misp_url', misp_url), level, body)
+                    queries.setdefault(url, {'label': label, 'level': level, 'body': body_file, 'url': url})
+    return list(queries.values())
+
+
+def _load_entries(filename):
+    with open(filename, 'rt', encoding='utf-8') as f:
+        content = f.read()
+    try:
+        entries = json.loads(content)
+    except json.JSONDecodeError:
+        entries = [json.loads(line) for line in content.splitlines() if line.strip()]
+    entries = entries if isinstance(entries, list) else [entries]
+    # A setup file, or a manifest whose entries contain a setup
+    return [entry if 'setup' in entry else {'setup': entry} for entry in entries if not entry.get('delete')]
+
+
+def load_bodies(filenames):
+    bodies = []
+    for filename in filenames:
+        with open(filename, 'rt', encoding='utf-8') as f:
+            bodies.append((filename, json.loads(f.read())))
+    return bodies
+
+
+def measure(url, headers=None, chunk_size=_CHUNK_SIZE):
+    """Download the restSearch results behind `url`, timing the response headers and the whole content.
+
+    The times include the retries of the query, if any are enabled, which are counted separately.
+    """
+    start = time.perf_counter()
+    try:
+        with get_session(url).get(url, headers=headers, stream=True) as response:
+            ttfb = time.perf_counter() - start
+            retries = len(getattr(getattr(response.raw, 'retries', None), 'history', ()))
+            if response.status_code != 200:
+                return {'error': f'{response.status_code} - {response.reason}', 'retries': retries}
+            size = sum(len(chunk) for chunk in response.iter_content(chunk_size=chunk_size))
+    except requests.RequestException as error:
+        return {'error': str(error), 'retries': 0}
+    return {'ttfb': ttfb, 'total': time.perf_counter() - start, 'size': size, 'retries': retries}
+
+
+def profile(queries, repeat=1, concurrency=4, headers=None):
+    jobs = [query for query in queries for _ in range(repeat)]
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        measures = list(executor.map(lambda query: measure(query['url'], headers=headers), jobs))
+    profiles = []
+    for index, query in enumerate(queries):
+        runs = measures[index * repeat:(index + 1) * repeat]
+        successful = [run for run in runs if 'error' not in run]
+        result = dict(query, runs=repeat, errors=len(runs) - len(successful), retries=sum(run['retries'] for run in runs))
+        if successful:
+            total = statistics.median(run['total'] for run in successful)
+            size = max(run['size'] for run in successful)
+            result.update(
+                ttfb_ms=round(statistics.median(run['ttfb'] for run in successful) * 1000, 3),
+                total_ms=round(total * 1000, 3), max_ms=round(max(run['total'] for run in successful) * 1000, 3),
+                size=size, throughput_kbps=round(size / 1024 / total, 2) if total else None
+            )
+        else:
+            result['error'] = runs[0]['error']
+        profiles.append(result)
+    return profiles
+
+
+def rank(profiles, sort='total'):
+    """Most expensive queries first: the slowest, largest or with the lowest throughput. Failed ones last."""
+    key = {'size': 'size', 'throughput': 'throughput_kbps', 'total': 'total_ms', 'ttfb': 'ttfb_ms'}[sort]
+    measured = [result for result in profiles if result.get(key) is not None]
+    failed = [result for result in profiles if result.get(key) is None]
+    return sorted(measured, key=lambda result: result[key], reverse=sort != 'throughput') + failed
+
+
+def display_profiles(profiles):
+    print(f"{'#':>3}  {'query':<40} {'level':<10} {'size':>12} {'ttfb':>11} {'total':>11} {'throughput':>14}")
+    for index, result in enumerate(profiles, 1):
+        name = result['label'] if len(result['label']) <= 40 else f"{result['label'][:37]}..."
+        if 'error' in result:
+            print(f"{index:>3}  {name:<40} {result['level']:<10} /!\\ {result['error']} /!\\")
+            continue
+        print(
+            f"{index:>3}  {name:<40} {result['level']:<10} {result['size']:>10} B "
+            f"{result['ttfb_ms']:>8.1f} ms {result['total_ms']:>8.1f} ms {result['throughput_kbps']:>9.1f} KiB/s"
+        )
+        if result['retries']:
+            print(f"     /!\\ {result['retries']} retried attempt(s) included in the measures /!\\")
+        print(f"     {result['url']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the cost of the restSearch queries behind the resources, before publishing them.')
+    parser.add_argument('--setup', nargs='+', default=[f'{_ABSOLUTE_PATH}/setup.json'], help='Setup files, or manifest files, of the resources to profile. (using setup.json file if not set)')
+    parser.add_argument('--body', nargs='+', default=[f'{_ABSOLUTE_PATH}/body.json'], help='Bodies of the queries, each one combined with each setup. (using body.json file if not set)')
+    parser.add_argument('--level', nargs='+', default=['events'], help='Levels to query (events, attributes, ...), each one combined with each setup & body.')
+    parser.add_argument('--misp_url', default='https://misppriv.circl.lu', help='Url of the MISP instance.')
+    parser.add_argument('--misp_auth', help='MISP API key used to download the restSearch results.')
+    parser.add_argument('--concurrency', type=int, default=4, help='Number of queries sent concurrently.')
+    parser.add_argument('--repeat', type=int, default=1, help='Number of times each query is sent (the median times are kept).')
+    parser.add_argument('--sort', choices=_SORT_KEYS, default='total', help='Measure used to rank the queries.')
+    parser.add_argument('--output', help='File to write the ranked measures to, in JSON format.')
+    parser.add_argument('--mock', action='store_true', help='Send the queries to a local stand-in of MISP (mock_misp.py) instead of --misp_url.')
+    parser.add_argument('--attributes', type=int, default=1000, help='With --mock, number of attributes returned by the queries without limit filter.')
+    parser.add_argument('--latency', type=float, default=0.0, help='With --mock, fixed delay before each response, in seconds.')
+    parser.add_argument('--jitter', type=float, default=0.0, help='With --mock, maximum random delay added on top of the fixed one, in seconds.')
+    parser.add_argument('--throughput', type=float, default=0.0, help='With --mock, maximum number of bytes per second of each response (0 for no limit).')
+    add_arguments(parser)
+    # Neither queued behind the limiter of the portals nor silently retried, unless explicitly requested
+    parser.set_defaults(rate_limit=0, retries=0)
+    args = parser.parse_args()
+    configure_from_arguments(args)
+
+    misp = None
+    if args.mock:
+        misp = MockMISP(attributes=args.attributes, latency=args.latency, jitter=args.jitter, throughput=args.throughput)
+    try:
+        queries = build_queries(args.setup, load_bodies(args.body), args.level, misp.url if misp is not None else args.misp_url)
+    except (FileNotFoundError, PermissionError, json.JSONDecodeError, AttributeError, KeyError, TypeError) as error:
+        print(f'/!\\ The setup or body files cannot be loaded. /!\\ \n{error}')
+        sys.exit(1)
+    try:
+        if misp is not None:
+            misp.start()
+        profiles = rank(profile(queries, args.repeat, args.concurrency, headers=misp_headers(args.misp_auth)), args.sort)
+    finally:
+        if misp is not None:
+            misp.stop()
+    display_profiles(profiles)
+    if args.output:
+        with open(args.output, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps({'timestamp': datetime.now().isoformat(), 'sort': args.sort, 'queries': profiles}, indent=4))
+        print(f'Results written in {args.output}')
+    sys.exit(1 if any('error' in result for result in profiles) else 0)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import copy
+import json
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+from journal import open_journal
+from opendata import display_summary, group_manifest, load_defaults, load_manifest, process_manifest_group
+
+_ABSOLUTE_PATH = pathlib.Path(__file__).parent.absolute()
+
+
+async def _publish_group(executor, semaphore, auth, portal_url, defaults, group, journal):
+    async with semaphore:
+        # The entries are completed with portal specific fields, each portal works on its own copy
+        return await asyncio.get_event_loop().run_in_executor(
+            executor, process_manifest_group, auth, portal_url, defaults, copy.deepcopy(group), journal
+        )
+
+
+async def _publish_portal(executor, concurrency, auth, portal_url, defaults, groups, journal):
+    semaphore = asyncio.Semaphore(concurrency)
+    results = await asyncio.gather(
+        *(_publish_group(executor, semaphore, auth, portal_url, defaults, group, journal) for group in groups)
+    )
+    return [result for group_results in results for result in group_results]
+
+
+async def publish(portals, entries, defaults, concurrency=4, journal=None):
+    """Send every entry to all the portals at once, with at most `concurrency` datasets in progress per portal.
+
+    Returns the results of each portal, keyed by portal url.
+    """
+    groups = list(group_manifest(entries).values())
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1) * len(portals)) as executor:
+        results = await asyncio.gather(
+            *(_publish_portal(executor, max(concurrency, 1), auth, portal_url, defaults, groups, journal) for auth, portal_url in portals)
+        )
+    return {portal_url: portal_results for (_, portal_url), portal_results in zip(portals, results)}
+
+
+def _load_entries(args):
+    if args.manifest:
+        return load_manifest(args.manifest, args)
+    if args.delete:
+        return [{'delete': args.delete}], load_defaults(args)
+    filename = args.setup if args.setup is not None else f'{_ABSOLUTE_PATH}/setup.json'
+    with open(filename, 'rt', encoding='utf-8') as f:
+        return [{'setup': json.loads(f.read())}], load_defaults(args)
+
+
+def run_fanout(portals, args):
+    try:
+        entries, defaults = _load_entries(args)
+    except (FileNotFoundError, PermissionError, json.JSONDecodeError) as error:
+        print(f'/!\\ The files to publish cannot be loaded. /!\\ \n{error}')
+        return 1
+    loop = asyncio.new_event_loop()
+    try:
+        with open_journal(args.journal, resume=args.resume) as journal:
+            results = loop.run_until_complete(
+                publish(portals, entries, defaults, concurrency=args.portal_concurrency, journal=journal)
+            )
+    finally:
+        loop.close()
+    failed = [portal_url for portal_url, portal_results in results.items() if display_summary(portal_results, title=f'{portal_url} summary')]
+    if failed:
+        print(f"\nSome operations failed on: {', '.join(failed)}")
+    return 1 if failed else 0
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+_LOCK = threading.Lock()
+_LIMITERS = {}
+_MAX_BACKOFF = 60
+_RATE_LIMIT_HEADERS = (
+    ('X-RateLimit-Remaining', 'X-RateLimit-Reset'),
+    ('RateLimit-Remaining', 'RateLimit-Reset')
+)
+
+
+class TokenBucket():
+    """Token bucket shared by all the queries to a portal.
+
+    The rate is halved each time the portal throttles us and slowly recovers up to
+    the configured rate afterwards, while Retry-After and rate-limit headers pause
+    every query to the portal until the given time.
+    """
+    def __init__(self, rate, burst):
+        self._max_rate = rate
+        self._rate = rate
+        self._burst = max(burst, 1)
+        self._tokens = float(self._burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._blocked_until - now
+                if wait <= 0:
+                    if not self._max_rate:
+                        return
+                    self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+    def block(self, delay):
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+
+    def record_success(self):
+        if self._max_rate:
+            with self._lock:
+                self._rate = min(self._rate + self._max_rate / 20, self._max_rate)
+
+    def record_throttle(self, delay):
+        with self._lock:
+            if self._max_rate:
+                self._rate = max(self._rate / 2, self._max_rate / 32)
+                self._tokens = min(self._tokens, 0)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+
+    def tune(self, rate, burst):
+        # Limits advertised by the portal, taking over the configured ones when lower
+        with self._lock:
+            self._max_rate = rate
+            self._rate = min(self._rate, rate) if self._rate else rate
+            self._burst = max(burst, 1)
+            self._tokens = min(self._tokens, self._burst)
+
+
+def _parse_delay(value):
+    if value is None:
+        return None
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max((date - datetime.now(timezone.utc)).total_seconds(), 0)
+    # Reset headers are either a number of seconds or an epoch timestamp
+    return max(delay - time.time(), 0) if delay > 1e9 else max(delay, 0)
+
+
+def get_limiter(portal, rate, burst):
+    with _LOCK:
+        if portal not in _LIMITERS:
+            _LIMITERS[portal] = TokenBucket(rate, burst)
+        return _LIMITERS[portal]
+
+
+def header_delay(response):
+    """Number of seconds the portal asks us to wait before the next query, if any."""
+    retry_after = _parse_delay(response.headers.get('Retry-After'))
+    if retry_after is not None:
+        return retry_after
+    for remaining, reset in _RATE_LIMIT_HEADERS:
+        if response.headers.get(remaining) == '0':
+            return _parse_delay(response.headers.get(reset))
+    return None
+
+
+def reset_limiters():
+    with _LOCK:
+        _LIMITERS.clear()
+
+
+def throttle_delay(response, attempt):
+    delay = header_delay(response)
+    return delay if delay is not None else random.uniform(0, min(2 ** attempt, _MAX_BACKOFF))
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pathlib
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from helpers import iterate_pages
+from portals import get_adapter
+from transport import get_session
+
+_ABSOLUTE_PATH = pathlib.Path(__file__).parent.absolute()
+_INDEX_PATH = _ABSOLUTE_PATH / '.cache' / 'datasets.sqlite'
+_INDEXES = {}
+_LOCK = threading.Lock()
+_PAGE_SIZE = 50
+_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS datasets (
+    portal TEXT NOT NULL,
+    id TEXT NOT NULL,
+    slug TEXT,
+    title TEXT,
+    last_modified TEXT,
+    indexed_at REAL NOT NULL,
+    PRIMARY KEY (portal, id)
+)''',
+    'CREATE INDEX IF NOT EXISTS datasets_slug ON datasets (portal, slug)',
+    'CREATE INDEX IF NOT EXISTS datasets_title ON datasets (portal, title)',
+    '''CREATE TABLE IF NOT EXISTS refreshes (
+    portal TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    last_modified TEXT NOT NULL,
+    refreshed_at REAL NOT NULL,
+    PRIMARY KEY (portal, scope)
+)'''
+)
+_SEARCH_PAGE_SIZE = 20
+
+
+class DatasetIndex():
+    """Id of the datasets of each portal, by title & slug."""
+    def __init__(self, path=_INDEX_PATH):
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        with self._connection:
+            for statement in _SCHEMA:
+                self._connection.execute(statement)
+
+    def find(self, portal, title):
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT id FROM datasets WHERE portal = ? AND (title = ? OR slug = ?)', (portal, title, title)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def forget(self, portal, identifier):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM datasets WHERE portal = ? AND (id = ? OR slug = ?)', (portal, identifier, identifier))
+
+    def record(self, portal, datasets):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO datasets VALUES (?, ?, ?, ?, ?, ?)',
+                [
+                    (portal, dataset['id'], dataset.get('slug'), dataset.get('title'), dataset.get('last_modified'), now)
+                    for dataset in datasets
+                ]
+            )
+
+    def set_watermark(self, portal, scope, last_modified):
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO refreshes VALUES (?, ?, ?, ?)', (portal, scope, last_modified, time.time())
+            )
+
+    def watermark(self, portal, scope):
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT last_modified FROM refreshes WHERE portal = ? AND scope = ?', (portal, scope)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+
+class DatasetResolver():
+    """Find the dataset with a given title using the query parameters of the portal.
+
+    The datasets of the owner met are kept in the index, so the next lookups of the same
+    title only cost a query of the public dataset document, served by the metadata cache
+    while it is fresh. When the search of the portal does not know the title yet, the
+    datasets of the owner are listed from the most recently modified ones, stopping at
+    the ones already indexed during the previous refresh.
+    """
+    def __init__(self, api_url, headers=None, index=None, page_size=_PAGE_SIZE, display=print):
+        self._api_url = api_url
+        self._display = display
+        self._headers = headers
+        self._index = index if index is not None else get_index()
+        self._page_size = page_size
+        self._session = get_session(api_url)
+
+    def forget(self, identifier):
+        self._index.forget(self._api_url, identifier)
+
+    def record(self, dataset):
+        self._index.record(self._api_url, [dataset])
+
+    def refresh(self, owner):
+        """Index the datasets of the owner (and its organizations) modified since the previous refresh."""
+        scopes = [('owner', owner['id'])] + [('organization', organization['id']) for organization in owner.get('organizations', [])]
+        for key, value in scopes:
+            scope = f'{key}={value}'
+            watermark = self._index.watermark(self._api_url, scope)
+            latest = watermark
+            datasets = []
+            for dataset in iterate_pages(f'{self._api_url}datasets/?{scope}&sort=-last_modified', headers=self._headers, page_size=self._page_size, display=self._display):
+                if watermark is not None and dataset.get('last_modified', '') < watermark:
+                    break
+                datasets.append(dataset)
+                latest = max(latest or '', dataset.get('last_modified', ''))
+            self._index.record(self._api_url, datasets)
+            if latest:
+                self._index.set_watermark(self._api_url, scope, latest)
+
+    def resolve(self, title, owner=None):
+        """Return the dataset with the given title (owned by `owner` or one of its organizations, if set), or None."""
+        dataset = self._from_index(title, owner)
+        if dataset is not None:
+            return dataset
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            candidates = [executor.submit(self._get, '-'.join(title.lower().strip().split(' ')), owner)]
+            if get_adapter(self._api_url).capabilities['search']:
+                candidates.append(executor.submit(self._search, title, owner))
+            for candidate in as_completed(candidates):
+                dataset = candidate.result()
+                if self._matches(dataset, title, owner):
+                    return dataset
+        if owner is not None:
+            self.refresh(owner)
+            return self._from_index(title, owner)
+
+    ################################################################################
+    #                              UTILITY FUNCTIONS                               #
+    ################################################################################
+
+    def _from_index(self, title, owner):
+        for identifier in self._index.find(self._api_url, title):
+            dataset = self._get(identifier, owner)
+            if self._matches(dataset, title, owner):
+                return dataset
+            if dataset is None:
+                # Deleted since it has been indexed
+                self.forget(identifier)
+
+    def _get(self, identifier, owner=None):
+        # Without the API key, the query can be answered by the metadata cache: the owner is checked locally
+        url = f'{self._api_url}datasets/{identifier}/'
+        response = self._session.get(url)
+        if response.status_code == 404 and self._headers:
+            # Private datasets are only visible with the key of their owner
+            response = self._session.get(url, headers=self._headers)
+        if response.status_code != 200:
+            return None
+        dataset = response.json()
+        if self._owned(dataset, owner):
+            self.record(dataset)
+        return dataset
+
+    @classmethod
+    def _matches(cls, dataset, title, owner):
+        if dataset is None or title not in (dataset.get('title'), dataset.get('slug')):
+            return False
+        return cls._owned(dataset, owner)
+
+    @staticmethod
+    def _owned(dataset, owner):
+        if owner is None:
+            return True
+        organizations = {organization['id'] for organization in owner.get('organizations', [])}
+        return (dataset.get('owner') or {}).get('id') == owner['id'] or (dataset.get('organization') or {}).get('id') in organizations
+
+    def _search(self, title, owner):
+        response = self._session.get(
+            f'{self._api_url}datasets/', headers=self._headers, params={'q': title, 'page_size': _SEARCH_PAGE_SIZE}
+        )
+        if response.status_code != 200:
+            return None
+        # The search covers the whole portal, only the datasets of the owner are kept in the index
+        datasets = [dataset for dataset in response.json().get('data', []) if self._owned(dataset, owner)]
+        self._index.record(self._api_url, datasets)
+        for dataset in datasets:
+            if self._matches(dataset, title, owner):
+                return dataset
+
+
+def get_index(path=_INDEX_PATH):
+    with _LOCK:
+        if path not in _INDEXES:
+            _INDEXES[path] = DatasetIndex(path)
+        return _INDEXES[path]
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import copy
+import heapq
+import json
+import os
+import pathlib
+import random
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from opendata import group_manifest, load_manifest, process_manifest_group
+
+_ABSOLUTE_PATH = pathlib.Path(__file__).parent.absolute()
+_STATE_PATH = _ABSOLUTE_PATH / '.cache' / 'schedule.json'
+_DAY = 86400
+# Update frequencies accepted by udata, in seconds
+_FREQUENCIES = {
+    'continuous': 300,
+    'hourly': 3600,
+    'fourTimesADay': _DAY / 4,
+    'threeTimesADay': _DAY / 3,
+    'semidaily': _DAY / 2,
+    'daily': _DAY,
+    'fourTimesAWeek': 7 * _DAY / 4,
+    'threeTimesAWeek': 7 * _DAY / 3,
+    'semiweekly': 7 * _DAY / 2,
+    'weekly': 7 * _DAY,
+    'biweekly': 14 * _DAY,
+    'threeTimesAMonth': 10 * _DAY,
+    'semimonthly': 15 * _DAY,
+    'monthly': 30 * _DAY,
+    'bimonthly': 60 * _DAY,
+    'quarterly': 91 * _DAY,
+    'threeTimesAYear': 122 * _DAY,
+    'semiannual': 182 * _DAY,
+    'annual': 365 * _DAY,
+    'biennial': 2 * 365 * _DAY,
+    'triennial': 3 * 365 * _DAY,
+    'quinquennial': 5 * 365 * _DAY
+}
+_MAX_INITIAL_DELAY = 60
+
+
+class Scheduler():
+    """Resident process refreshing the datasets of a registry according to their update frequency.
+
+    The next run of each dataset is kept in a priority queue and persisted after every
+    refresh, so a restarted daemon resumes the schedule instead of refreshing everything.
+    """
+    def __init__(self, auth, portal_url, defaults, state_path=_STATE_PATH, workers=4, jitter=0.1, default_interval=None):
+        self._auth = auth
+        self._portal_url = portal_url
+        self._defaults = defaults
+        self._state_path = pathlib.Path(state_path)
+        self._workers = max(workers, 1)
+        self._jitter = jitter
+        self._default_interval = default_interval
+        self._condition = threading.Condition()
+        self._jobs = {}
+        self._queue = []
+        self._stopped = False
+        self._state = self._load_state()
+
+    def add_dataset(self, title, group):
+        frequency = 'unknown'
+        for _, entry in group:
+            if isinstance(entry.get('setup'), dict):
+                frequency = entry['setup']['dataset'].get('frequency', frequency)
+        interval = _FREQUENCIES.get(frequency, self._default_interval)
+        if interval is None:
+            print(f'The dataset {title} has no regular update frequency ({frequency}), it will not be refreshed.')
+            return
+        self._jobs[title] = (interval, group)
+        next_run = self._state.get(title, {}).get('next_run')
+        if next_run is None:
+            # Spread the first runs instead of refreshing every dataset at once
+            next_run = time.time() + random.uniform(0, min(self._jitter * interval, _MAX_INITIAL_DELAY))
+        heapq.heappush(self._queue, (next_run, title))
+
+    def run(self):
+        print(f'Scheduler started with {len(self._jobs)} dataset(s) to refresh.')
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            with self._condition:
+                while not self._stopped:
+                    now = time.time()
+                    while self._queue and self._queue[0][0] <= now:
+                        _, title = heapq.heappop(self._queue)
+                        executor.submit(self._refresh, title)
+                    self._condition.wait(self._queue[0][0] - now if self._queue else None)
+        self._save_state()
+        print('Scheduler stopped.')
+
+    def stop(self, *args):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    ################################################################################
+    #                              UTILITY FUNCTIONS                               #
+    ################################################################################
+
+    def _load_state(self):
+        try:
+            with open(self._state_path, 'rt', encoding='utf-8') as f:
+                return json.loads(f.read())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _refresh(self, title):
+        interval, group = self._jobs[title]
+        start = time.time()
+        try:
+            results = process_manifest_group(self._auth, self._portal_url, self._defaults, copy.deepcopy(group))
+            status = all(result[-1] for result in results)
+        except Exception as error:
+            print(f'/!\\ The refresh of the dataset {title} failed. /!\\ \n{error}')
+            status = False
+        next_run = time.time() + interval + random.uniform(0, self._jitter * interval)
+        with self._condition:
+            self._state[title] = {'last_run': start, 'last_status': status, 'next_run': next_run}
+            heapq.heappush(self._queue, (next_run, title))
+            self._save_state()
+            self._condition.notify_all()
+        print(f"[{datetime.now().isoformat(timespec='seconds')}] Dataset {title} refreshed: {'OK' if status else 'FAILED'}, next refresh at {datetime.fromtimestamp(next_run).isoformat(timespec='seconds')}.")
+
+    def _save_state(self):
+        self._state_path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self._state_path.with_suffix('.tmp')
+        with open(temporary, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps(self._state, indent=4))
+        os.replace(temporary, self._state_path)
+
+
+def run_daemon(auth, portal_url, args):
+    try:
+        entries, defaults = load_manifest(args.daemon, args)
+    except (FileNotFoundError, PermissionError, json.JSONDecodeError) as error:
+        print(f'/!\\ The registry file specified ({args.daemon}) cannot be loaded. /!\\ \n{error}')
+        return 1
+    scheduler = Scheduler(
+        auth, portal_url, defaults, state_path=args.schedule_state, workers=args.workers,
+        jitter=args.schedule_jitter, default_interval=args.default_interval
+    )
+    for title, group in group_manifest(entries).items():
+        if title is not None:
+            scheduler.add_dataset(title, group)
+    signal.signal(signal.SIGTERM, scheduler.stop)
+    signal.signal(signal.SIGINT, scheduler.stop)
+    scheduler.run()
+    return 0
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import hmac
+import json
+import os
+import pathlib
+import secrets
+import signal
+import socketserver
+import threading
+from api import OpendataClient
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from transport import add_arguments, configure_from_arguments
+
+_ABSOLUTE_PATH = pathlib.Path(__file__).parent.absolute()
+_SOCKET_PATH = _ABSOLUTE_PATH / '.cache' / 'server.sock'
+_TOKEN_HEADER = 'X-Opendata-Token'
+_TOKEN_PATH = _ABSOLUTE_PATH / '.cache' / 'server.token'
+_SUBMIT_FIELDS = (
+    'body',
+    'level',
+    'misp_url',
+    'portal_url',
+    'auth',
+    'checksum_type',
+    'misp_auth',
+    'incremental'
+)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _CommandHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    client = None
+    token = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if urlsplit(self.path).path.strip('/') == 'health':
+            return self._send(200, {'status': True})
+        self._send(404, {'status': False, 'messages': ['Not found']})
+
+    def do_POST(self):
+        command = urlsplit(self.path).path.strip('/')
+        # A cross-origin page cannot send this content type nor the token header without a preflight, never answered
+        rejection = None
+        if self.headers.get_content_type() != 'application/json':
+            rejection = (415, 'The query must be sent as application/json.')
+        elif not self.token or not hmac.compare_digest(self.headers.get(_TOKEN_HEADER, '').encode(), self.token.encode()):
+            rejection = (401, f'Missing or invalid {_TOKEN_HEADER} header.')
+        if rejection is not None:
+            # The body is left unread, the connection cannot be reused
+            self.close_connection = True
+            return self._send(rejection[0], {'status': False, 'messages': [rejection[1]]})
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            query = json.loads(self.rfile.read(length)) if length else {}
+        except ValueError:
+            return self._send(400, {'status': False, 'messages': ['The query is not a valid JSON document.']})
+        if not isinstance(query, dict):
+            return self._send(400, {'status': False, 'messages': ['The query must be a JSON object.']})
+        if command == 'submit':
+            if not isinstance(query.get('setup'), dict):
+                return self._send(400, {'status': False, 'messages': ['The submit query requires a setup.']})
+            arguments = {field: query[field] for field in _SUBMIT_FIELDS if query.get(field) is not None}
+            return self._send(200, self.client.submit(query['setup'], **arguments))
+        if command in ('delete', 'search'):
+            to_process = query.get(command)
+            if not to_process or not isinstance(to_process, list):
+                return self._send(400, {'status': False, 'messages': [f'The {command} query requires a list with a dataset (and resources).']})
+            function = getattr(self.client, command)
+            return self._send(200, function(to_process, portal_url=query.get('portal_url'), auth=query.get('auth')))
+        self._send(404, {'status': False, 'messages': [f'Unknown command: {command}']})
+
+    def _send(self, status, content):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def create_server(client, token, host='127.0.0.1', port=8470, socket_path=None):
+    # TCP_NODELAY only applies to TCP sockets
+    handler = type(
+        'CommandHandler', (_CommandHandler,),
+        {'client': client, 'token': token, 'disable_nagle_algorithm': socket_path is None}
+    )
+    if socket_path is None:
+        return ThreadingHTTPServer((host, port), handler)
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    pathlib.Path(socket_path).parent.mkdir(parents=True, exist_ok=True)
+    # Only reachable by the user running the server
+    umask = os.umask(0o177)
+    try:
+        return _UnixHTTPServer(str(socket_path), handler)
+    finally:
+        os.umask(umask)
+
+
+def load_token(token=None, path=_TOKEN_PATH):
+    """Shared secret expected in the X-Opendata-Token header: the given one, or the one of the token file (created if needed)."""
+    if token is not None:
+        return token
+    path = pathlib.Path(path)
+    try:
+        with open(path, 'rt', encoding='utf-8') as f:
+            token = f.read().strip()
+        if token:
+            return token
+    except FileNotFoundError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    token = secrets.token_urlsafe(32)
+    with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wt', encoding='utf-8') as f:
+        f.write(token)
+    os.chmod(path, 0o600)
+    return token
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Answer the submit, search & delete commands of opendata.py from a resident process.')
+    parser.add_argument('--socket', default=str(_SOCKET_PATH), help='Unix socket to listen on, only accessible by the user running the server. (.cache/server.sock if not set)')
+    parser.add_argument('--host', help='Address to listen on, over TCP instead of the Unix socket. (127.0.0.1 if only --port is set)')
+    parser.add_argument('--port', type=int, help='Port to listen on, over TCP instead of the Unix socket. (8470 if only --host is set)')
+    parser.add_argument('--token', help=f'Shared secret the queries must send in the {_TOKEN_HEADER} header. (read from, or generated in, .cache/server.token if not set)')
+    parser.add_argument('--token_file', default=str(_TOKEN_PATH), help='File the shared secret is read from, or generated in, when --token is not set.')
+    parser.add_argument('--portal_url', default='data.public.lu', help='Url of the Open data portal used when a query does not specify one.')
+    parser.add_argument('--auth', help='Authentication required for the opendata portal (API key). (using auth.json file if not set, nor specified in the queries)')
+    parser.add_argument('--body', help='Body used when a submit query does not specify one. (using body.json file if not set)')
+    parser.add_argument('--level', default='events', help='Level used when a submit query does not specify one.')
+    parser.add_argument('--misp_url', default='https://misppriv.circl.lu', help='Url of the MISP instance used when a submit query does not specify one.')
+    add_arguments(parser)
+    args = parser.parse_args()
+    configure_from_arguments(args)
+    body = None
+    if args.body is not None:
+        with open(args.body, 'rt', encoding='utf-8') as f:
+            body = json.loads(f.read())
+    client = OpendataClient(args.auth, args.portal_url, body=body, level=args.level, misp_url=args.misp_url)
+    tcp = args.host is not None or args.port is not None
+    socket_path = None if tcp else args.socket
+    host, port = args.host or '127.0.0.1', args.port or 8470
+    server = create_server(client, load_token(args.token, args.token_file), host, port, socket_path)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    print(f"Opendata server listening on {socket_path or f'http://{host}:{port}/'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import gzip
+import hashlib
+import os
+import pathlib
+import requests
+from transport import get_misp_session
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_ABSOLUTE_PATH = pathlib.Path(__file__).parent.absolute()
+_CHUNK_SIZE = 1024 * 1024
+_EXTENSIONS = {
+    'gzip': 'gz',
+    'zstd': 'zst'
+}
+_MIME_TYPES = {
+    'gzip': 'application/gzip',
+    'zstd': 'application/zstd'
+}
+_SNAPSHOTS_PATH = _ABSOLUTE_PATH / '.cache' / 'snapshots'
+COMPRESSIONS = tuple(_EXTENSIONS)
+
+
+class _HashingFile():
+    """Binary file computing the checksum & size of what is written in it."""
+    def __init__(self, path, checksum_type):
+        self._file = open(path, 'wb')
+        self._hasher = hashlib.new(checksum_type)
+        self.size = 0
+
+    @property
+    def checksum(self):
+        return self._hasher.hexdigest()
+
+    def close(self):
+        self._file.close()
+
+    def flush(self):
+        self._file.flush()
+
+    def write(self, data):
+        self._file.write(data)
+        self._hasher.update(data)
+        self.size += len(data)
+        return len(data)
+
+
+class _SnapshotPart():
+    """Compressed file of a snapshot, with the checksum & size of its compressed content."""
+    def __init__(self, path, compression, checksum_type):
+        self.path = path
+        self._checksum_type = checksum_type
+        self._file = _HashingFile(path, checksum_type)
+        if compression == 'zstd':
+            self._stream = zstandard.ZstdCompressor().stream_writer(self._file, closefd=False)
+        else:
+            # Without modification time, the same content always gives the same checksum
+            self._stream = gzip.GzipFile(filename=path.name[:-3], mode='wb', fileobj=self._file, mtime=0)
+
+    @property
+    def size(self):
+        return self._file.size
+
+    def close(self):
+        self._stream.close()
+        self._file.close()
+        return {
+            'path': self.path, 'filesize': self._file.size,
+            'checksum': {'type': self._checksum_type, 'value': self._file.checksum}
+        }
+
+    def write(self, data):
+        self._stream.write(data)
+
+
+def mime_type(compression):
+    return _MIME_TYPES[compression]
+
+
+def snapshot_settings(args):
+    if args.snapshot is None:
+        return None
+    part_size = int(args.snapshot_part_size * 1024 * 1024) if args.snapshot_part_size else None
+    return {'compression': args.snapshot, 'part_size': part_size, 'directory': args.snapshot_directory or _SNAPSHOTS_PATH}
+
+
+def write_snapshot(url, path, compression='gzip', part_size=None, headers=None, checksum_type='sha256', display=print):
+    """Download the content behind `url` once, compressing it on the fly into one or several files.
+
+    With `part_size`, a new file is started at the first line break after the current one
+    reaches this compressed size; the files then have to be concatenated to get the whole
+    content back. Returns the path, size & checksum of each file, or None if the content
+    cannot be fetched.
+    """
+    if compression == 'zstd' and zstandard is None:
+        display('/!\\ The zstandard package is required to compress the snapshots with zstd. /!\\ ')
+        return None
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    extension = _EXTENSIONS[compression]
+    parts = []
+    part = None
+    try:
+        with get_misp_session(url).get(url, headers=headers, stream=True) as response:
+            if response.status_code != 200:
+                display(f'/!\\ Unable to export the content of {url}. /!\\ \n{response.status_code} - {response.reason}')
+                return None
+            for chunk in response.iter_content(chunk_size=_CHUNK_SIZE):
+                while chunk:
+                    if part is None:
+                        name = f'{path.name}.part{len(parts) + 1}' if part_size else path.name
+                        part = _SnapshotPart(path.with_name(f'{name}.{extension}'), compression, checksum_type)
+                    cut = chunk.find(b'\n') + 1 if part_size and part.size >= part_size else 0
+                    if not cut:
+                        part.write(chunk)
+                        break
+                    part.write(chunk[:cut])
+                    parts.append(part.close())
+                    part = None
+                    chunk = chunk[cut:]
+    except requests.RequestException as error:
+        display(f'/!\\ Unable to export the content of {url}. /!\\ \n{error}')
+        if part is not None:
+            part.close()
+        return None
+    if part is None and not parts:
+        part = _SnapshotPart(path.with_name(f'{path.name}.{extension}'), compression, checksum_type)
+    if part is not None:
+        parts.append(part.close())
+    # Files left by a previous snapshot with more parts
+    for stale in path.parent.glob(f'{path.name}.part*.{extension}'):
+        if stale not in [part['path'] for part in parts]:
+            os.remove(stale)
+    return parts
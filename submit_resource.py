@@ -1,9 +1,18 @@
 import argparse
+import helpers
 import json
-import requests
+import metrics
+import portals
+import sys
+from checksum import CHECKSUM_TYPES, misp_headers, stream_checksum
 from datetime import datetime
+from helpers import iterate_resources, parse_fields, project
+from portals import find_portal, get_adapter, load_supported_portals
+from resolver import DatasetResolver
+from transport import add_arguments, configure_from_arguments, get_session
 
-_API_URL = 'https://data.public.lu/api/1/'
+_PORTAL_URL = 'https://data.public.lu/'
+_API_URL = get_adapter(_PORTAL_URL).api_url
 _DATETIME_REGEXES = (
     '%Y-%m-%d',
     '%Y-%m-%dT%H:%M:%S',
@@ -50,16 +59,16 @@ def fetch_dataset(datasets, title, feature):
     return f"No dataset with the specified title in your {feature} datasets."
 
 
-def get_dataset(authentication_key, title):
+def get_dataset(authentication_key, title, page_size=50):
     auth = {'X-API-KEY': authentication_key}
-    for feature in ('datasets', 'org_datasets'):
-        datasets = requests.get(f"{_API_URL}me/{feature}/", headers=auth)
-        if datasets.status_code != 200:
-            print(f"Error while searching for your {feature}: {datasets.reason}\n{datasets.text}")
-            continue
-        for dataset in datasets.json():
-            if dataset['title'] == title:
-                return dataset
+    me = get_session(_API_URL).get(f'{_API_URL}me', headers=auth)
+    if me.status_code != 200:
+        print(f"Error while fetching the information of your account:\n{display_error(me)}")
+        return
+    # Your datasets and the ones of your organizations
+    dataset = DatasetResolver(_API_URL, headers=auth, page_size=page_size).resolve(title, owner=me.json())
+    if dataset is not None:
+        return dataset
     print(f"You don't have any dataset with the specified title ({title}).")
 
 
@@ -73,6 +82,18 @@ def parse_publication_date(date):
     print(f"Your publication_date value ({date}) is not in a standard datetime format, please use one of the following format: {', '.join(_DATETIME_REGEXES)}")
 
 
+def compute_resource_fields(args, url):
+    if args.compute_checksum is None:
+        return {}
+    fields = stream_checksum(url, args.compute_checksum, headers=misp_headers(args.misp_auth))
+    if fields is None:
+        return {}
+    # Values explicitly given by the user take precedence over the computed ones
+    if any(getattr(args, field) is not None for field in _RESOURCE_HASH_FIELDS):
+        fields.pop('checksum')
+    return {field: value for field, value in fields.items() if getattr(args, field, None) is None}
+
+
 def parse_resource_fields(args):
     resource = {}
     if args.publication_date is not None:
@@ -87,13 +108,15 @@ def parse_resource_fields(args):
 
 
 def search_dataset(args):
+    if args.stream:
+        return stream_resources(args)
     if args.dataset_title is not None:
         if args.auth is None:
             print('The API key is required if you want to search for a dataset using its title')
-            return
-        dataset = get_dataset(args.auth, args.dataset_title)
+            return False
+        dataset = get_dataset(args.auth, args.dataset_title, page_size=args.page_size)
         if dataset is None:
-            return
+            return False
         if any(getattr(args, field) is not None for field in _RESOURCE_SEARCH_FIELDS):
             for field in _RESOURCE_SEARCH_FIELDS:
                 value = getattr(args, field)
@@ -103,32 +126,74 @@ def search_dataset(args):
                 for resource in dataset['resources']:
                     if resource[feature] == value:
                         print(f"Successfully found the requested resource:\n{json.dumps(resource, indent=4)}")
-                        return
+                        return True
             print(f"No result for the resource you requested, here is the full dataset instead:{json.dumps(dataset, indent=4)}")
-        else:
-            print(f"Successfully found the requested dataset:\n{json.dumps(dataset, indent=4)}")
+            return False
+        print(f"Successfully found the requested dataset:\n{json.dumps(dataset, indent=4)}")
+        return True
     else:
         query = f"datasets/{args.dataset_id if args.dataset_id is not None else args.dataset_slug}/"
         if args.resource_id is not None:
-            resource = requests.get(f"{_API_URL}{query}resources/{args.resource_id}/")
+            resource = get_session(_API_URL).get(f"{_API_URL}{query}resources/{args.resource_id}/")
             if resource.status_code == 200:
                 print(f"Successfully found the requested resource:\n{json.dumps(resource.json(), indent=4)}")
-            else:
-                print(f"Error while searching the requested resource:\n{display_error(resource)}")
+                return True
+            print(f"Error while searching the requested resource:\n{display_error(resource)}")
+            return False
+        dataset = get_session(_API_URL).get(f"{_API_URL}{query}/")
+        if dataset.status_code != 200:
+            print(f"Error with the requested dataset:\n{display_error(dataset)}")
+            return False
+        if args.resource_title is not None:
+            for resource in dataset.json()['resources']:
+                if resource['title'] == args.resource_title:
+                    print(f"Successfully found the requested resource:\n{json.dumps(resource, indent=4)}")
+                    return True
+            print("No result for the resource you requested, here is the full dataset instead:")
         else:
-            dataset = requests.get(f"{_API_URL}{query}/")
-            if dataset.status_code == 200:
-                if args.resource_title is not None:
-                    for resource in dataset.json()['resources']:
-                        if resource['title'] == args.resource_title:
-                            print(f"Successfully found the requested resource:\n{json.dumps(resource, indent=4)}")
-                            return
-                    print("No result for the resource you requested, here is the full dataset instead:")
-                else:
-                    print("Successfully found the requested dataset:")
-                print(json.dumps(dataset.json(), indent=4))
-            else:
-                print(f"Error with the requested dataset:\n{display_error(dataset)}")
+            print("Successfully found the requested dataset:")
+        print(json.dumps(dataset.json(), indent=4))
+        return args.resource_title is None
+
+
+def set_portal(url_arg):
+    global _API_URL
+    # Same portals as opendata.py: `data.gouv.fr` is the portal served from https://www.data.gouv.fr/
+    supported_portals = load_supported_portals()
+    portal_url = find_portal(url_arg, supported_portals)
+    if not portal_url:
+        portal_urls = '\n - '.join(supported_portals)
+        print(f'/!\\ The provided portal url is not supported yet (or misspelled). /!\\ \nPlease choose one of the followings:\n - {portal_urls}')
+        sys.exit(0)
+    _API_URL = get_adapter(portal_url).api_url
+    helpers.set_portal(portal_url)
+
+
+def stream_resources(args):
+    fields = parse_fields(args.fields)
+    def display(resources):
+        for resource in resources:
+            if args.resource_id is not None and resource['id'] != args.resource_id:
+                continue
+            if args.resource_title is not None and resource['title'] != args.resource_title:
+                continue
+            print(json.dumps(project(resource, fields), separators=(',', ':')))
+    if args.dataset_title is not None:
+        if args.auth is None:
+            print('The API key is required if you want to search for a dataset using its title')
+            return False
+        dataset = get_dataset(args.auth, args.dataset_title, page_size=args.page_size)
+        if dataset is None:
+            return False
+        display(dataset['resources'])
+        return True
+    query = f"datasets/{args.dataset_id if args.dataset_id is not None else args.dataset_slug}/"
+    with get_session(_API_URL).get(f"{_API_URL}{query}", stream=True) as dataset:
+        if dataset.status_code != 200:
+            print(f"Error with the requested dataset:\n{display_error(dataset)}")
+            return False
+        display(iterate_resources(dataset))
+    return True
 
 
 def submit_resource(args):
@@ -139,35 +204,43 @@ def submit_resource(args):
     for field in _RESOURCE_OPTIONAL_FIELDS:
         if getattr(args, field) is not None:
             resource[field] = getattr(args, field)
+    resource.update(compute_resource_fields(args, resource['url']))
     resource.update(parse_resource_fields(args))
-    submission = requests.post(f"{_API_URL}datasets/{args.dataset_id}/resources/", headers=auth, json=resource)
+    submission = get_session(_API_URL).post(f"{_API_URL}datasets/{args.dataset_id}/resources/", headers=auth, json=resource)
     if submission.status_code == 201:
         print(f'Resource successfully added to the given dataset.\n{json.dumps(submission.json(), indent=4)}')
-    else:
-        print(f'Error while submitting your resource:\n{display_error(submission)}')
+        return True
+    print(f'Error while submitting your resource:\n{display_error(submission)}')
+    return False
 
 
 def update_resource(args):
     auth = {'X-API-KEY': args.auth}
-    resource = requests.get(f"{_API_URL}datasets/{args.dataset_id}/resources/{args.resource_id}/")
+    resource = get_session(_API_URL).get(f"{_API_URL}datasets/{args.dataset_id}/resources/{args.resource_id}/")
     if resource.status_code != 200:
         print(f"Error while fetching the information of the resource to update:\n{display_error(resource)}")
-        return
+        return False
     resource = resource.json()
     for field in _RESOURCE_UPDATE_FIELDS:
         feature = getattr(args, field)
         if feature is not None:
             resource[field] = feature
+    resource.update(compute_resource_fields(args, resource['url']))
     resource.update(parse_resource_fields(args))
-    update = requests.put(f"{_API_URL}datasets/{args.dataset_id}/resources/{args.resource_id}/", headers=auth, json=resource)
+    update = get_session(_API_URL).put(f"{_API_URL}datasets/{args.dataset_id}/resources/{args.resource_id}/", headers=auth, json=resource)
     if update.status_code == 200:
         print(f'Resource  successfully updated.\n{json.dumps(update.json(), indent=4)}')
-    else:
-        print(f'Error while updating your resource:\n{display_error(update)}')
+        return True
+    print(f'Error while updating your resource:\n{display_error(update)}')
+    return False
 
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='Submit resources on data.public.lu')
+    parser = argparse.ArgumentParser(description='Submit resources on the supported Open data portals.')
+    parser.add_argument('--portal_url', default=_PORTAL_URL, help='Url of the Open data portal.')
+    add_arguments(parser)
+    metrics.add_arguments(parser)
+    portals.add_arguments(parser)
     subparsers = parser.add_subparsers()
 
     submit_parser = subparsers.add_parser('submit', help='Submit a resource.')
@@ -185,6 +258,8 @@ if __name__ == '__main__':
     checksum.add_argument('--md5', help='Resource file MD5 hash.')
     checksum.add_argument('--sha1', help='Resource file SHA1 hash.')
     checksum.add_argument('--sha256', help='Resource file SHA256 hash.')
+    submit_parser.add_argument('--compute_checksum', choices=CHECKSUM_TYPES, help='Download the resource URL to compute its checksum (with the given hash algorithm), file size and mime type.')
+    submit_parser.add_argument('--misp_auth', help='MISP API key used to download the resource URL when computing its checksum.')
     submit_parser.set_defaults(func=submit_resource)
 
     update_parser = subparsers.add_parser('update', help='Update existing resource')
@@ -203,6 +278,8 @@ if __name__ == '__main__':
     checksum.add_argument('--md5', help='Resource file MD5 to update.')
     checksum.add_argument('--sha1', help='Resource file SHA1 to update.')
     checksum.add_argument('--sha256', help='Resource file SHA256 to update.')
+    update_parser.add_argument('--compute_checksum', choices=CHECKSUM_TYPES, help='Download the resource URL to compute its checksum (with the given hash algorithm), file size and mime type.')
+    update_parser.add_argument('--misp_auth', help='MISP API key used to download the resource URL when computing its checksum.')
     update_parser.set_defaults(func=update_resource)
 
     search_parser = subparsers.add_parser('search', help='Search for a dataset.')
@@ -214,9 +291,16 @@ if __name__ == '__main__':
     resource_identifier = search_parser.add_mutually_exclusive_group()
     resource_identifier.add_argument('--resource_id', help='Resource ID.')
     resource_identifier.add_argument('--resource_title', help='Resource title')
+    search_parser.add_argument('--page_size', type=int, default=50, help='Number of datasets fetched per page while searching by title.')
+    search_parser.add_argument('--stream', action='store_true', help='Display the resources of the dataset as soon as they are received, one compact JSON document per line.')
+    search_parser.add_argument('--fields', help='Comma separated list of the resource fields displayed with --stream (e.g. id,title,url,last_modified).')
     search_parser.set_defaults(func=search_dataset)
 
     args = parser.parse_args()
+    metrics.setup(args)
+    configure_from_arguments(args)
+    portals.setup(args)
+    set_portal(args.portal_url)
     try:
         args.func(args)
     except:
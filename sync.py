@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import requests
+from checksum import compute_checksums, misp_headers
+from concurrent.futures import ThreadPoolExecutor
+from opendata import OpendataExport, load_manifest
+from resolver import DatasetResolver
+
+_DATASET_GENERATED_FIELDS = (
+    'created_at',
+    'last_modified',
+    'last_updated',
+    'page',
+    'uri'
+)
+_DATASET_REQUIRED_FIELDS = (
+    'title',
+    'description'
+)
+_RESOURCE_REQUIRED_FIELDS = (
+    'title',
+    'type',
+    'url',
+    'format'
+)
+_SYMBOLS = {
+    'create': '+',
+    'delete': '-',
+    'update': '~'
+}
+
+
+class OpendataSync(OpendataExport):
+    """Desired state of a dataset, reconciled with the portal using the minimal set of writes."""
+    def __init__(self, auth, url, title):
+        super().__init__(auth, url)
+        self.title = title
+        self.dataset = {}
+        self.resources = {}
+        self.absent = set()
+        self.delete_dataset = False
+        self.prune = False
+        self.unchanged = 0
+
+    def add_entry(self, entry, defaults):
+        if entry.get('delete'):
+            if len(entry['delete']) == 1:
+                self.delete_dataset = True
+            else:
+                self.absent.update(entry['delete'][1:])
+            return
+        self.dataset.update(entry['setup']['dataset'])
+        self.prune |= bool(entry.get('prune'))
+        resources = entry['setup'].get('resources', [])
+        for resource in resources if isinstance(resources, list) else [resources]:
+            self.load_query(
+                {'resources': dict(resource)}, entry.get('body', defaults['body']),
+                level=entry.get('level', defaults['level']),
+                misp_url=entry.get('misp_url', defaults['misp_url'])
+            )
+            self._check_resources_fields()
+            self.resources[resource['title']] = self.setup['resources']
+
+    ################################################################################
+    #                            MAIN PARSING FUNCTIONS                            #
+    ################################################################################
+
+    def apply(self, operations):
+        applied = True
+        for operation in operations:
+            if operation['action'] == 'delete':
+                applied &= self._send_delete_request(operation['target'], operation['title'], feature=operation['feature'])
+                continue
+            response = self._session.request(operation['method'], operation['url'], headers=self._auth, json=operation['payload'])
+            applied &= self._handle_response(f"{operation['action']}d", operation['feature'], response, operation['status'])
+        return applied
+
+    def plan(self):
+        self.unchanged = 0
+        owner = self._get_owner()
+        if owner is None:
+            print(f'/!\\ Unable to fetch the current state of the dataset {self.title}. /!\\ ')
+            return None
+        # The title is resolved among the datasets of the owner, the portal only answers by id or slug
+        current = DatasetResolver(self._api_url, headers=self._auth).resolve(self.title, owner=owner)
+        if current is None:
+            return [] if self.delete_dataset else [self._plan_dataset_creation()]
+        if self.delete_dataset:
+            return [self._operation('delete', 'dataset', self.title, target=current['id'])]
+        operations = []
+        changes = self._diff(self.dataset, current, _DATASET_GENERATED_FIELDS)
+        if changes:
+            payload = self._payload(self.dataset, current, changes, _DATASET_REQUIRED_FIELDS)
+            operations.append(
+                self._operation(
+                    'update', 'dataset', self.title, changes=changes, method='PUT',
+                    url=f"{self._api_url}datasets/{current['id']}/", payload=payload, status=200
+                )
+            )
+        elif self.dataset:
+            self.unchanged += 1
+        operations.extend(self._plan_resources(current))
+        return operations
+
+    ################################################################################
+    #                          SPECIFIC PARSING FUNCTIONS                          #
+    ################################################################################
+
+    def _plan_dataset_creation(self):
+        self.setup = {'dataset': dict(self.dataset)}
+        if 'slug' not in self.setup['dataset']:
+            self.setup['dataset']['slug'] = '-'.join(self.title.lower().strip().split(' '))
+        self._check_dataset_fields()
+        payload = self.setup['dataset']
+        if self.resources:
+            payload['resources'] = list(self.resources.values())
+        return self._operation(
+            'create', 'dataset', self.title, method='POST',
+            url=f'{self._api_url}datasets/', payload=payload, status=201
+        )
+
+    def _plan_resources(self, dataset):
+        operations = []
+        url = f"{self._api_url}datasets/{dataset['id']}/resources/"
+        current_resources = {resource['title']: resource for resource in dataset['resources']}
+        for title, resource in self.resources.items():
+            if title not in current_resources:
+                operations.append(
+                    self._operation(
+                        'create', 'resource', title, method='POST',
+                        url=url, payload=resource, status=201
+                    )
+                )
+                continue
+            current = current_resources[title]
+            changes = self._diff(resource, current)
+            if not changes:
+                self.unchanged += 1
+                continue
+            operations.append(
+                self._operation(
+                    'update', 'resource', title, changes=changes, method='PUT',
+                    url=f"{url}{current['id']}/", status=200,
+                    payload=self._payload(resource, current, changes, _RESOURCE_REQUIRED_FIELDS)
+                )
+            )
+        to_delete = set(current_resources) - set(self.resources) if self.prune else self.absent
+        for title in sorted(to_delete & set(current_resources)):
+            operations.append(
+                self._operation(
+                    'delete', 'resource', title,
+                    target=f"{dataset['id']}/resources/{current_resources[title]['id']}"
+                )
+            )
+        return operations
+
+    ################################################################################
+    #                              UTILITY FUNCTIONS                               #
+    ################################################################################
+
+    @staticmethod
+    def _diff(desired, current, ignored=()):
+        return {
+            field: (current.get(field), value) for field, value in desired.items()
+            if field not in ignored and current.get(field) != value
+        }
+
+    def _operation(self, action, feature, title, **kwargs):
+        kwargs.update({'action': action, 'feature': feature, 'title': title, 'dataset': self.title})
+        return kwargs
+
+    @staticmethod
+    def _payload(desired, current, changes, required_fields):
+        payload = {field: desired.get(field, current.get(field)) for field in required_fields}
+        payload.update((field, value) for field, (_, value) in changes.items())
+        return payload
+
+
+def _display_plan(operations):
+    for operation in operations:
+        name = f'"{operation["dataset"]}"'
+        if operation['feature'] == 'resource':
+            name = f'{name} / "{operation["title"]}"'
+        print(f"{_SYMBOLS[operation['action']]} {operation['feature']} {name}")
+        for field, (before, after) in operation.get('changes', {}).items():
+            print(f'    {field}: {json.dumps(before)} -> {json.dumps(after)}')
+
+
+def _plan_dataset(dataset_sync):
+    try:
+        return dataset_sync.plan()
+    except requests.RequestException as error:
+        print(f'/!\\ Your query encountered an error. /!\\ \n{error}')
+
+
+def _apply_dataset(dataset_sync, operations):
+    try:
+        return dataset_sync.apply(operations)
+    except requests.RequestException as error:
+        print(f'/!\\ Your query encountered an error. /!\\ \n{error}')
+        return False
+
+
+def run_sync(auth, portal_url, args):
+    try:
+        entries, defaults = load_manifest(args.sync, args)
+    except (FileNotFoundError, PermissionError, json.JSONDecodeError) as error:
+        print(f'/!\\ The desired state file specified ({args.sync}) cannot be loaded. /!\\ \n{error}')
+        return 1
+    datasets = {}
+    try:
+        for entry in entries:
+            title = entry['delete'][0] if entry.get('delete') else entry['setup']['dataset']['title']
+            if title not in datasets:
+                datasets[title] = OpendataSync(dict(auth), portal_url, title)
+            datasets[title].add_entry(entry, defaults)
+    except (AttributeError, KeyError, TypeError) as error:
+        print(f'/!\\ Invalid entry in the desired state file: {entry} /!\\ \nMissing or invalid field: {error}')
+        return 1
+    if defaults['checksum_type'] is not None:
+        resources = [resource for dataset_sync in datasets.values() for resource in dataset_sync.resources.values()]
+        checksums = compute_checksums(
+            [resource['url'] for resource in resources], defaults['checksum_type'],
+            headers=misp_headers(defaults['misp_auth']), workers=args.workers
+        )
+        for resource, fields in zip(resources, checksums):
+            if fields is not None:
+                resource.update(fields)
+    with ThreadPoolExecutor(max_workers=max(args.workers, 1)) as executor:
+        plans = list(executor.map(_plan_dataset, datasets.values()))
+    counts = dict.fromkeys(_SYMBOLS, 0)
+    for operations in plans:
+        if operations:
+            _display_plan(operations)
+            for operation in operations:
+                counts[operation['action']] += 1
+    unchanged = sum(dataset_sync.unchanged for dataset_sync in datasets.values())
+    print(f"Plan: {counts['create']} to create, {counts['update']} to update, {counts['delete']} to delete, {unchanged} unchanged.")
+    failed = sum(1 for operations in plans if operations is None)
+    if args.plan:
+        return 1 if failed else 0
+    to_apply = [(dataset_sync, operations) for dataset_sync, operations in zip(datasets.values(), plans) if operations]
+    with ThreadPoolExecutor(max_workers=max(args.workers, 1)) as executor:
+        results = list(executor.map(lambda item: _apply_dataset(*item), to_apply))
+    failed += results.count(False)
+    print(f'{len(to_apply) - results.count(False)} dataset(s) synchronised, {failed} failed.')
+    return 1 if failed else 0
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pathlib
+import requests
+import tempfile
+import unittest
+from cache import MetadataCache
+from mock_portal import MockPortal
+
+
+class _Sender():
+    """Query the mock portal like PortalSession does, keeping the conditional headers of each query."""
+    def __init__(self, url):
+        self.url = url
+        self.queries = []
+
+    def __call__(self, conditional):
+        self.queries.append(conditional)
+        return requests.get(self.url, headers=conditional)
+
+
+class TestMetadataCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.portal = MockPortal(datasets=3, resources=1)
+        cls.portal.start()
+        cls.datasets = sorted(cls.portal.state.datasets.values(), key=lambda dataset: dataset['slug'])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.portal.stop()
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        # Registered first, so removed once the caches are closed
+        self.addCleanup(self._directory.cleanup)
+
+    def _cache(self, name='metadata', **kwargs):
+        cache = MetadataCache(path=pathlib.Path(self._directory.name) / f'{name}.sqlite', **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def _get(self, cache, identifier, *path):
+        url = f"{self.portal.url}api/1/datasets/{'/'.join((identifier,) + path)}/"
+        sender = _Sender(url)
+        return cache.get(url, sender), sender.queries
+
+    def test_cacheable_urls(self):
+        url = f'{self.portal.url}api/1/datasets/dataset-0/'
+        self.assertTrue(MetadataCache.is_cacheable(url, None))
+        self.assertTrue(MetadataCache.is_cacheable(f'{url}resources/resource-id/', {'Accept': 'application/json'}))
+        # Listings & authenticated queries depend on the query or on the user
+        self.assertFalse(MetadataCache.is_cacheable(f'{self.portal.url}api/1/datasets/?owner=mock-user', None))
+        self.assertFalse(MetadataCache.is_cacheable(url, {'x-api-key': 'key'}))
+        self.assertFalse(MetadataCache.is_cacheable(f'{self.portal.url}api/1/me/', None))
+
+    def test_fresh_entries(self):
+        cache = self._cache(ttl=60)
+        response, queries = self._get(cache, 'dataset-0')
+        self.assertEqual(queries, [{}])
+        self.assertEqual(response.json()['slug'], 'dataset-0')
+        # Within the ttl, the trailing slash & the percent-encoding do not matter
+        cached, queries = self._get(cache, 'dataset%2D0')
+        self.assertEqual(queries, [])
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(cached.json(), response.json())
+        self.assertEqual(cached.headers['ETag'], response.headers['ETag'])
+
+    def test_revalidation(self):
+        cache = self._cache(ttl=0)
+        response, _ = self._get(cache, 'dataset-1')
+        cached, queries = self._get(cache, 'dataset-1')
+        # The stale entry is revalidated, and the 304 answered with the stored document
+        self.assertEqual(queries, [{'If-None-Match': response.headers['ETag']}])
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(cached.json(), response.json())
+        dataset = self.portal.state.find('dataset-1')
+        with self.portal.state.lock:
+            dataset['description'] = 'Changed on the portal.'
+        self.addCleanup(dataset.update, {'description': response.json()['description']})
+        changed, queries = self._get(cache, 'dataset-1')
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(changed.json()['description'], 'Changed on the portal.')
+        self.assertNotEqual(changed.headers['ETag'], response.headers['ETag'])
+
+    def test_revalidation_refreshes_the_entry(self):
+        cache = self._cache(ttl=0)
+        self._get(cache, 'dataset-2')
+        self._get(cache, 'dataset-2')
+        # Once revalidated, the entry is fresh again for the duration of the ttl
+        cache._ttl = 60
+        _, queries = self._get(cache, 'dataset-2')
+        self.assertEqual(queries, [])
+
+    def test_missing_dataset(self):
+        cache = self._cache(ttl=60)
+        for _ in range(2):
+            response, queries = self._get(cache, 'missing')
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(len(queries), 1)
+
+    def test_least_recently_used_trimming(self):
+        cache = self._cache(ttl=60, max_entries=2)
+        self._get(cache, 'dataset-0')
+        self._get(cache, 'dataset-1')
+        # Reading dataset-0 again makes dataset-1 the least recently used entry
+        self._get(cache, 'dataset-0')
+        self._get(cache, 'dataset-2')
+        for slug, expected in (('dataset-0', 0), ('dataset-2', 0), ('dataset-1', 1)):
+            with self.subTest(slug=slug):
+                _, queries = self._get(cache, slug)
+                self.assertEqual(len(queries), expected)
+
+    def test_invalidation_of_the_aliases(self):
+        dataset = self.datasets[0]
+        resource = dataset['resources'][0]
+        for target in (dataset['slug'], dataset['id']):
+            with self.subTest(invalidated=target):
+                cache = self._cache(target, ttl=60)
+                # The same dataset is cached under its slug & its id, along with one of its resources
+                self._get(cache, dataset['slug'])
+                self._get(cache, dataset['id'])
+                self._get(cache, dataset['slug'], 'resources', resource['id'])
+                cache.invalidate(f"{self.portal.url}api/1/datasets/{target}/resources/{resource['id']}/")
+                for path in ((dataset['slug'],), (dataset['id'],), (dataset['slug'], 'resources', resource['id'])):
+                    _, queries = self._get(cache, *path)
+                    self.assertEqual(len(queries), 1)
+                # The other datasets are kept
+                self._get(cache, self.datasets[1]['slug'])
+                cache.invalidate(f"{self.portal.url}api/1/datasets/{dataset['id']}/")
+                _, queries = self._get(cache, self.datasets[1]['slug'])
+                self.assertEqual(queries, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import unittest
+from helpers import _ResourcesParser, iterate_resources
+
+_DATASET = {
+    'id': 'dataset-id',
+    'title': 'Tricky "resources": [ {title} ] \\ é',
+    'description': '", "resources": [{"id": "escaped"}]',
+    'extras': {'resources': [{'id': 'nested'}], 'note': 'ends with a backslash \\'},
+    'tags': ['resources', '[', ']', '{', '}', ',', ':'],
+    'resources': [
+        {'id': 'first', 'title': 'Quoted \\"title\\" and \\\\ backslashes', 'url': 'https://misp.local/a'},
+        {'id': 'second', 'title': 'Unicode é€\U0001f600', 'extras': {'resources': []}},
+        {'id': 'third', 'title': 'Brackets ] } [ {', 'filesize': 42}
+    ],
+    'owner': {'id': 'owner-id'}
+}
+
+
+class _Response():
+    """Streamed response returning its content in chunks of the requested size."""
+    def __init__(self, content, encoding='utf-8'):
+        self.content = content
+        self.encoding = encoding
+
+    def iter_content(self, chunk_size):
+        for position in range(0, len(self.content), chunk_size):
+            yield self.content[position:position + chunk_size]
+
+
+def _parse(document, chunk_size):
+    parser = _ResourcesParser()
+    resources = []
+    for position in range(0, len(document), chunk_size):
+        resources.extend(parser.feed(document[position:position + chunk_size]))
+    resources.extend(parser.feed(''))
+    return resources
+
+
+class TestResourcesParser(unittest.TestCase):
+    def test_chunk_boundaries(self):
+        # Every chunk size splits the document inside the strings, escape sequences & resources at least once
+        document = json.dumps(_DATASET)
+        for chunk_size in range(1, len(document) + 1):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(_parse(document, chunk_size), _DATASET['resources'])
+
+    def test_escaped_characters(self):
+        document = json.dumps(_DATASET, ensure_ascii=False)
+        for chunk_size in (1, 2, 3, 7):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(_parse(document, chunk_size), _DATASET['resources'])
+
+    def test_nested_resources_key(self):
+        document = json.dumps({'extras': {'resources': [{'id': 'nested'}]}, 'resources': [{'id': 'top-level'}]})
+        self.assertEqual(_parse(document, 5), [{'id': 'top-level'}])
+
+    def test_nested_resources_key_only(self):
+        document = json.dumps({'extras': {'resources': [{'id': 'nested'}]}})
+        self.assertEqual(_parse(document, 5), [])
+
+    def test_empty_list(self):
+        for document in ('{"resources": []}', '{"id": "dataset-id", "resources": [ ], "title": "Empty"}'):
+            with self.subTest(document=document):
+                self.assertEqual(_parse(document, 1), [])
+
+    def test_missing_key(self):
+        document = json.dumps({'id': 'dataset-id', 'title': 'No resources'})
+        parser = _ResourcesParser()
+        self.assertEqual(list(parser.feed(document)), [])
+        # Nothing after the end of the document is parsed
+        self.assertEqual(list(parser.feed('{"resources": [{"id": "after"}]}')), [])
+
+
+class TestIterateResources(unittest.TestCase):
+    def test_multibyte_characters_across_chunks(self):
+        content = json.dumps(_DATASET, ensure_ascii=False).encode('utf-8')
+        for chunk_size in (1, 2, 3, 5):
+            with self.subTest(chunk_size=chunk_size):
+                resources = list(iterate_resources(_Response(content), chunk_size=chunk_size))
+                self.assertEqual(resources, _DATASET['resources'])
+
+    def test_response_encoding(self):
+        content = json.dumps({'resources': [{'title': 'Données'}]}, ensure_ascii=False).encode('latin-1')
+        resources = list(iterate_resources(_Response(content, encoding='latin-1'), chunk_size=4))
+        self.assertEqual(resources, [{'title': 'Données'}])
+
+    def test_missing_encoding(self):
+        content = json.dumps({'resources': [{'title': 'Données'}]}, ensure_ascii=False).encode('utf-8')
+        self.assertEqual(list(iterate_resources(_Response(content, encoding=None), chunk_size=3)), [{'title': 'Données'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import unittest
+from opendata import OpendataExport
+
+_RESOURCES = [
+    {'id': 'a1', 'title': 'Events 2023'},
+    {'id': 'b2', 'title': 'Events 2024'},
+    {'id': 'c3', 'title': 'a1'},
+    {'id': 'd4', 'title': 'Events*'},
+    {'id': 'e5', 'title': 're:Events'},
+    {'id': 'f6', 'title': 'Attributes [tlp:white]'},
+    {'id': 'g7', 'title': 'Events 2024'}
+]
+
+
+class _MatchingExport(OpendataExport):
+    """OpendataExport without any portal, keeping the messages it displays."""
+    def __init__(self):
+        self.messages = []
+
+    def _display(self, message):
+        self.messages.append(message)
+
+
+def _ids(resources):
+    return [resource['id'] for resource in resources]
+
+
+class TestMatchResources(unittest.TestCase):
+    def setUp(self):
+        self.export = _MatchingExport()
+
+    def _match(self, *selectors):
+        resources, not_found = self.export._match_resources(_RESOURCES, list(selectors))
+        return _ids(resources), not_found
+
+    def test_id(self):
+        # The id of a resource wins over the title of another one
+        self.assertEqual(self._match('a1'), (['a1'], []))
+
+    def test_title(self):
+        self.assertEqual(self._match('Events 2024'), (['b2', 'g7'], []))
+        self.assertEqual(self._match('Attributes [tlp:white]'), (['f6'], []))
+
+    def test_exact_title_before_patterns(self):
+        # Titles looking like a glob pattern or a regular expression are matched as they are
+        self.assertEqual(self._match('Events*'), (['d4'], []))
+        self.assertEqual(self._match('re:Events'), (['e5'], []))
+
+    def test_regular_expression(self):
+        self.assertEqual(self._match('re:20(23|24)$'), (['a1', 'b2', 'g7'], []))
+        # Searched anywhere in the title, case sensitive
+        self.assertEqual(self._match('re:vents'), (['a1', 'b2', 'd4', 'e5', 'g7'], []))
+        self.assertEqual(self._match('re:^events'), ([], ['re:^events']))
+
+    def test_glob(self):
+        self.assertEqual(self._match('Events 202?'), (['a1', 'b2', 'g7'], []))
+        self.assertEqual(self._match('*2023'), (['a1'], []))
+        self.assertEqual(self._match('events*'), ([], ['events*']))
+
+    def test_invalid_regular_expression(self):
+        self.assertEqual(self._match('re:Events (', 'a1'), (['a1'], ['re:Events (']))
+        self.assertEqual(len(self.export.messages), 1)
+        self.assertIn('The regular expression Events ( is invalid.', self.export.messages[0])
+
+    def test_not_found(self):
+        self.assertEqual(self._match('Missing', 'zz', 'Events 2024'), (['b2', 'g7'], ['Missing', 'zz']))
+        self.assertEqual(self.export.messages, [])
+
+    def test_duplicates(self):
+        # Each resource is returned once, in the order it has first been selected
+        self.assertEqual(
+            self._match('g7', 'Events 2024', 're:^Events 20', 'Events*', 'b2', '*'),
+            (['g7', 'b2', 'a1', 'd4', 'c3', 'e5', 'f6'], [])
+        )
+
+    def test_no_selector(self):
+        self.assertEqual(self._match(), ([], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
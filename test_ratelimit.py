@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from mock_portal import MockPortal
+from ratelimit import TokenBucket, _parse_delay, header_delay, throttle_delay
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from transport import _DEFAULT_SETTINGS, PortalSession
+from unittest import mock
+
+
+class _CountingBucket(TokenBucket):
+    """Token bucket keeping track of the queries it let through & of the throttled ones."""
+    def __init__(self, rate, burst):
+        super().__init__(rate, burst)
+        self.acquired = 0
+        self.throttles = []
+
+    def acquire(self):
+        super().acquire()
+        self.acquired += 1
+
+    def record_throttle(self, delay):
+        super().record_throttle(delay)
+        self.throttles.append(delay)
+
+
+def _response(headers):
+    response = Response()
+    response.status_code = 429
+    response.headers = CaseInsensitiveDict(headers)
+    return response
+
+
+def _timed(function, *args):
+    start = time.monotonic()
+    function(*args)
+    return time.monotonic() - start
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst(self):
+        bucket = TokenBucket(rate=10, burst=3)
+        self.assertLess(sum(_timed(bucket.acquire) for _ in range(3)), 0.05)
+        # Once the burst is spent, the next token comes at the configured rate
+        self.assertAlmostEqual(_timed(bucket.acquire), 0.1, delta=0.05)
+
+    def test_unlimited(self):
+        bucket = TokenBucket(rate=0, burst=1)
+        self.assertLess(sum(_timed(bucket.acquire) for _ in range(100)), 0.05)
+        bucket.record_throttle(0)
+        self.assertEqual(bucket.rate, 0)
+
+    def test_throttle_and_recovery(self):
+        bucket = TokenBucket(rate=64, burst=1)
+        bucket.record_throttle(0)
+        self.assertEqual(bucket.rate, 32)
+        for _ in range(10):
+            bucket.record_throttle(0)
+        # Never below 1/32 of the configured rate
+        self.assertEqual(bucket.rate, 2)
+        bucket.record_success()
+        self.assertEqual(bucket.rate, 2 + 64 / 20)
+        for _ in range(40):
+            bucket.record_success()
+        self.assertEqual(bucket.rate, 64)
+
+    def test_block(self):
+        bucket = TokenBucket(rate=0, burst=1)
+        bucket.block(0.2)
+        # A shorter block does not shorten the current one
+        bucket.block(0.05)
+        self.assertGreaterEqual(_timed(bucket.acquire), 0.15)
+        self.assertLess(_timed(bucket.acquire), 0.05)
+
+    def test_tune(self):
+        bucket = TokenBucket(rate=10, burst=20)
+        bucket.tune(2, 1)
+        self.assertEqual(bucket.rate, 2)
+        bucket.acquire()
+        self.assertAlmostEqual(_timed(bucket.acquire), 0.5, delta=0.1)
+
+
+class TestDelays(unittest.TestCase):
+    def test_seconds(self):
+        self.assertEqual(_parse_delay('5'), 5)
+        self.assertEqual(_parse_delay('2.5'), 2.5)
+        self.assertEqual(_parse_delay('-3'), 0)
+
+    def test_epoch(self):
+        self.assertAlmostEqual(_parse_delay(str(int(time.time()) + 30)), 30, delta=1.5)
+        self.assertEqual(_parse_delay(str(int(time.time()) - 30)), 0)
+
+    def test_http_date(self):
+        date = datetime.now(timezone.utc) + timedelta(seconds=30)
+        self.assertAlmostEqual(_parse_delay(format_datetime(date, usegmt=True)), 30, delta=1.5)
+        self.assertEqual(_parse_delay('Wed, 21 Oct 2015 07:28:00 GMT'), 0)
+
+    def test_invalid(self):
+        for value in (None, '', 'soon'):
+            with self.subTest(value=value):
+                self.assertIsNone(_parse_delay(value))
+
+    def test_header_delay(self):
+        self.assertEqual(header_delay(_response({'Retry-After': '3', 'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '10'})), 3)
+        self.assertEqual(header_delay(_response({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '10'})), 10)
+        self.assertEqual(header_delay(_response({'RateLimit-Remaining': '0', 'RateLimit-Reset': '7'})), 7)
+        # Queries are still allowed until the end of the window
+        self.assertIsNone(header_delay(_response({'RateLimit-Remaining': '1', 'RateLimit-Reset': '7'})))
+        self.assertIsNone(header_delay(_response({})))
+
+    def test_throttle_delay(self):
+        self.assertEqual(throttle_delay(_response({'Retry-After': '4'}), 0), 4)
+        for attempt in range(10):
+            with self.subTest(attempt=attempt):
+                self.assertLessEqual(throttle_delay(_response({}), attempt), min(2 ** attempt, 60))
+
+
+class TestThrottledSession(unittest.TestCase):
+    def _session(self, limiter, throttle_retries=3):
+        session = PortalSession(dict(_DEFAULT_SETTINGS, throttle_retries=throttle_retries), limiter=limiter)
+        self.addCleanup(session.close)
+        return session
+
+    @mock.patch('transport.throttle_delay', return_value=0)
+    def test_requeued_until_accepted(self, _):
+        limiter = _CountingBucket(rate=1000, burst=10)
+        with MockPortal(datasets=1, error_rate=0.5, error_status=429) as portal:
+            # The first two queries are throttled, the third one goes through
+            with mock.patch('mock_portal.random.random', side_effect=[0.0, 0.0, 0.9]):
+                response = self._session(limiter).get(f'{portal.url}api/1/datasets/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total'], 1)
+        self.assertEqual(limiter.acquired, 3)
+        self.assertEqual(limiter.throttles, [0, 0])
+        # Halved twice, then recovering from the accepted query
+        self.assertEqual(limiter.rate, 1000 / 4 + 1000 / 20)
+
+    @mock.patch('transport.throttle_delay', return_value=0)
+    def test_throttle_retries_exhausted(self, _):
+        limiter = _CountingBucket(rate=1000, burst=10)
+        with MockPortal(error_rate=1.0, error_status=429) as portal:
+            response = self._session(limiter, throttle_retries=2).get(f'{portal.url}api/1/datasets/')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(limiter.acquired, 3)
+        self.assertEqual(len(limiter.throttles), 3)
+
+    def test_throttled_queries_wait(self):
+        limiter = _CountingBucket(rate=0, burst=1)
+        with MockPortal(error_rate=0.5, error_status=429) as portal:
+            with mock.patch('mock_portal.random.random', side_effect=[0.0, 0.9]), mock.patch('ratelimit.random.uniform', return_value=0.2):
+                elapsed = _timed(self._session(limiter).get, f'{portal.url}api/1/datasets/')
+        # The re-queued query waits for the backoff of the throttled one
+        self.assertEqual(limiter.acquired, 2)
+        self.assertGreaterEqual(elapsed, 0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import random
+import requests
+import threading
+import time
+from cache import MetadataCache
+from functools import partial
+from metrics import REGISTRY
+from ratelimit import get_limiter, header_delay, reset_limiters, throttle_delay
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+from urllib3.util.retry import Retry
+
+_DEFAULT_SETTINGS = {
+    'cache': True,
+    'cache_size': 1000,
+    'cache_ttl': 60.0,
+    'pool_size': 10,
+    'rate_burst': 20,
+    'rate_limit': 10.0,
+    'retries': 3,
+    'throttle_retries': 5,
+    'backoff_factor': 0.5,
+    'connect_timeout': 5.0,
+    'read_timeout': 60.0,
+    'misp_read_timeout': 0.0,
+    'misp_retries': 0
+}
+_IDEMPOTENT_METHODS = frozenset(
+    ('DELETE', 'GET', 'HEAD', 'OPTIONS', 'PUT')
+)
+# 429 & 503 are handled by the portal rate limiter
+_RETRY_STATUSES = (
+    500,
+    502,
+    504
+)
+_LOCK = threading.Lock()
+_CACHE = None
+_MISP_SESSIONS = {}
+_PORTAL_LIMITS = {}
+_SESSIONS = {}
+_SETTINGS = dict(_DEFAULT_SETTINGS)
+
+
+class JitteredRetry(Retry):
+    """Exponential backoff with full jitter, to avoid synchronised retries from the worker threads."""
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff > 0 else 0
+
+
+class PortalSession(requests.Session):
+    """Pooled keep-alive session applying default connect/read timeouts to every request."""
+    def __init__(self, settings, cache=None, limiter=None):
+        super().__init__()
+        self.cache = cache
+        self.limiter = limiter
+        self.throttle_retries = settings['throttle_retries']
+        self.timeout = (settings['connect_timeout'], settings['read_timeout'])
+        retries = JitteredRetry(
+            total=settings['retries'],
+            backoff_factor=settings['backoff_factor'],
+            status_forcelist=_RETRY_STATUSES,
+            allowed_methods=_IDEMPOTENT_METHODS,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=settings['pool_size'],
+            pool_maxsize=settings['pool_size'],
+            max_retries=retries
+        )
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        if self.cache is None:
+            return super().request(method, url, **kwargs)
+        # Streamed bodies are consumed by the caller as they arrive and never stored
+        if method.upper() == 'GET' and not kwargs.get('stream') and self.cache.is_cacheable(url, kwargs.get('headers')):
+            return self.cache.get(url, partial(self._conditional_request, method, url, kwargs))
+        response = super().request(method, url, **kwargs)
+        if method.upper() in ('DELETE', 'PATCH', 'POST', 'PUT') and response.ok:
+            self.cache.invalidate(url)
+        return response
+
+    def send(self, request, **kwargs):
+        start = time.perf_counter()
+        bytes_sent = len(request.body) if request.body else 0
+        try:
+            response, retries = self._send_throttled(request, **kwargs)
+        except requests.RequestException:
+            REGISTRY.record_request(request.url, request.method, 'error', time.perf_counter() - start, bytes_sent=bytes_sent)
+            raise
+        if kwargs.get('stream'):
+            bytes_received = int(response.headers.get('Content-Length') or 0)
+        else:
+            bytes_received = len(response.content)
+        retry_history = getattr(getattr(response.raw, 'retries', None), 'history', ())
+        REGISTRY.record_request(
+            request.url, request.method, response.status_code, time.perf_counter() - start,
+            bytes_sent=bytes_sent, bytes_received=bytes_received, retries=retries + len(retry_history)
+        )
+        return response
+
+    def _send_throttled(self, request, **kwargs):
+        if self.limiter is None:
+            return super().send(request, **kwargs), 0
+        for attempt in range(self.throttle_retries + 1):
+            self.limiter.acquire()
+            response = super().send(request, **kwargs)
+            throttled = response.status_code == 429 or (response.status_code == 503 and request.method in _IDEMPOTENT_METHODS)
+            if not throttled:
+                break
+            # The query is queued behind the portal limiter instead of failing
+            self.limiter.record_throttle(throttle_delay(response, attempt))
+            if attempt < self.throttle_retries:
+                response.close()
+        else:
+            return response, attempt
+        delay = header_delay(response)
+        if delay:
+            self.limiter.block(delay)
+        else:
+            self.limiter.record_success()
+        return response, attempt
+
+    def _conditional_request(self, method, url, kwargs, conditional_headers):
+        kwargs = dict(kwargs)
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers.update(conditional_headers)
+        return super().request(method, url, headers=headers, **kwargs)
+
+
+def _portal_key(url: str) -> str:
+    parsed = urlsplit(url)
+    return f'{parsed.scheme}://{parsed.netloc}'
+
+
+def _portal_limits(key: str) -> tuple:
+    rate, burst = _SETTINGS['rate_limit'], _SETTINGS['rate_burst']
+    advertised_rate, advertised_burst = _PORTAL_LIMITS.get(key, (None, None))
+    if advertised_rate:
+        rate = min(rate, advertised_rate) if rate else advertised_rate
+    if advertised_burst:
+        burst = min(burst, advertised_burst)
+    return rate, burst
+
+
+def add_arguments(parser):
+    parser.add_argument('--cache_ttl', type=float, default=_DEFAULT_SETTINGS['cache_ttl'], help='Number of seconds the cached dataset & resource metadata are used without being revalidated.')
+    parser.add_argument('--no_cache', dest='cache', action='store_false', help='Disable the local dataset & resource metadata cache.')
+    parser.add_argument('--pool_size', type=int, default=_DEFAULT_SETTINGS['pool_size'], help='Maximum number of kept-alive connections per portal.')
+    parser.add_argument('--rate_limit', type=float, default=_DEFAULT_SETTINGS['rate_limit'], help='Maximum number of queries per second sent to each portal (0 for no limit).')
+    parser.add_argument('--rate_burst', type=int, default=_DEFAULT_SETTINGS['rate_burst'], help='Number of queries that can be sent at once before the rate limit applies.')
+    parser.add_argument('--retries', type=int, default=_DEFAULT_SETTINGS['retries'], help='Number of retries for idempotent requests on connection errors and 5xx responses.')
+    parser.add_argument('--connect_timeout', type=float, default=_DEFAULT_SETTINGS['connect_timeout'], help='Connection timeout in seconds.')
+    parser.add_argument('--read_timeout', type=float, default=_DEFAULT_SETTINGS['read_timeout'], help='Read timeout in seconds.')
+    parser.add_argument('--misp_read_timeout', type=float, default=_DEFAULT_SETTINGS['misp_read_timeout'], help='Read timeout in seconds of the restSearch downloads from MISP (0 for no limit, as large exports can take long before their first byte).')
+    parser.add_argument('--misp_retries', type=int, default=_DEFAULT_SETTINGS['misp_retries'], help='Number of retries of the restSearch downloads from MISP on connection errors and 5xx responses.')
+
+
+def configure(**settings):
+    unknown = set(settings) - set(_DEFAULT_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown transport settings: {', '.join(sorted(unknown))}")
+    global _CACHE
+    with _LOCK:
+        _SETTINGS.update((key, value) for key, value in settings.items() if value is not None)
+        for session in (*_SESSIONS.values(), *_MISP_SESSIONS.values()):
+            session.close()
+        _SESSIONS.clear()
+        _MISP_SESSIONS.clear()
+        if _CACHE is not None:
+            _CACHE.close()
+            _CACHE = None
+        reset_limiters()
+
+
+def configure_portal(url, rate_limit=None, rate_burst=None):
+    """Apply the rate limits advertised by a portal, when they are stricter than the configured ones."""
+    key = _portal_key(url)
+    with _LOCK:
+        _PORTAL_LIMITS[key] = (rate_limit, rate_burst)
+        rate, burst = _portal_limits(key)
+        if rate_limit or rate_burst:
+            get_limiter(key, rate, burst).tune(rate, burst)
+
+
+def configure_from_arguments(args):
+    configure(**{key: getattr(args, key, None) for key in _DEFAULT_SETTINGS})
+
+
+def get_misp_session(url: str) -> PortalSession:
+    """Session downloading restSearch results from MISP, neither rate limited nor cached like the portal ones.
+
+    Retrying a slow export would only repeat the load on MISP, so by default the downloads
+    are neither retried nor interrupted by a read timeout.
+    """
+    key = _portal_key(url)
+    with _LOCK:
+        if key not in _MISP_SESSIONS:
+            settings = dict(
+                _SETTINGS, retries=_SETTINGS['misp_retries'], read_timeout=_SETTINGS['misp_read_timeout'] or None
+            )
+            _MISP_SESSIONS[key] = PortalSession(settings)
+        return _MISP_SESSIONS[key]
+
+
+def get_session(url: str) -> PortalSession:
+    global _CACHE
+    key = _portal_key(url)
+    with _LOCK:
+        if key not in _SESSIONS:
+            if _SETTINGS['cache'] and _CACHE is None:
+                _CACHE = MetadataCache(ttl=_SETTINGS['cache_ttl'], max_entries=_SETTINGS['cache_size'])
+            limiter = get_limiter(key, *_portal_limits(key))
+            _SESSIONS[key] = PortalSession(_SETTINGS, cache=_CACHE, limiter=limiter)
+        return _SESSIONS[key]